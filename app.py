@@ -13,19 +13,114 @@ Then you could see the Web.
 
 
 # ===== Imports =====
-from flask import Flask, render_template, request
-import tkinter as tk
-from tkinter import messagebox, colorchooser, ttk
-from PIL import Image, ImageTk
+from flask import Flask, render_template, request, Response, abort, jsonify, url_for, current_app, g
 from qr_generator_version1 import qr_img as qr_img_v1
-from qr_generator_version2 import qr_img as qr_img_v2
-from qr_generator_version2 import generate_qr_code2, generate_step_images
+from qr_generator_version2 import qr_img as qr_img_v2, qr_svg
+from qr_generator_version2 import generate_step_image, STEP_COUNT, STEP_BORDER
+from qr_generator_version2 import generate_step_images, mask_sheet, ANIMATION_FORMATS, DeadlineExceeded
 import qr_generator_version2
-import io
 import base64
+import bisect
+import contextlib
+import csv
+import functools
+import gc
+import hashlib
+import io
+import itertools
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+from collections import Counter
 
 # ===== Flask App Initialization and Global Variables =====
-app = Flask(__name__)
+# Default settings of apps made by create_app(). FLASK_-prefixed environment variables
+# override them (e.g. FLASK_QR_WORKERS=8), and the config passed to create_app() overrides both.
+DEFAULT_CONFIG = {
+    # Debugger and reloader are for local development only
+    'DEBUG': False,
+    # PNG encoder preset for web responses: 'speed', 'balanced' or 'size'
+    'QR_PNG_PRESET': 'balanced',
+    # Embed images in the page as base64 (True) or reference the /qr.png and /qr.svg URLs (False)
+    'QR_INLINE_IMAGES': True,
+    # Show-masks compatibility: embed all 8 masks as separate images (masks_data 'img') instead of
+    # one contact sheet; costs 8 full-size encodes per request
+    'QR_INLINE_MASK_IMAGES': False,
+    # Browser/CDN cache lifetime of /qr.png and /qr.svg responses, in seconds
+    'QR_IMAGE_MAX_AGE': 31536000,
+    # Maximum number of items in one /api/qr batch request
+    'QR_API_MAX_BATCH': 500,
+    # Maximum number of codes in one /generate_zip upload
+    'QR_ZIP_MAX_ITEMS': 10000,
+    # Precompute encoder tables and render the demo content at startup
+    'QR_WARMUP': True,
+    # Contents built during warm-up
+    'QR_WARMUP_TEXTS': ['Hello QR!'],
+    # Record per-stage timing histograms of the generator (see qr_generator_version2.timing_snapshot)
+    'QR_STAGE_TIMING': False,
+    # Record request counts, latencies and sizes for /metrics
+    'QR_METRICS': True,
+    # Projected memory limit of the images rendered for one request, in bytes
+    'QR_MAX_RENDER_BYTES': 64 * 1024 * 1024,
+    # What to do above the limit: 'downscale' to the largest scale that fits, or 'reject'
+    'QR_OVERSIZE': 'downscale',
+    # Memory kept across requests by cached renders; renders above an eighth of it are not kept
+    'QR_RENDER_CACHE_BYTES': 32 * 1024 * 1024,
+    # Track the peak Python allocations of every request with tracemalloc (slows requests down)
+    'QR_TRACEMALLOC': False,
+    # Cold renders and builds running at once per process; cache hits never wait for a slot
+    'QR_MAX_CONCURRENT_RENDERS': os.cpu_count() or 1,
+    # Requests allowed to wait for a render slot, and how long each may wait, in seconds
+    'QR_RENDER_QUEUE': 32,
+    'QR_RENDER_QUEUE_TIMEOUT': 2.0,
+    # Retry-After (seconds) sent with 503 responses when the queue is full or the wait times out
+    'QR_RETRY_AFTER': 1,
+    # Time budget of a request in seconds, after which generation stops with 504 (None: no limit)
+    'QR_DEADLINE': 10.0,
+    # Per-endpoint budgets overriding QR_DEADLINE
+    'QR_ROUTE_DEADLINES': {
+        'generate_qr': 5.0,
+        'qr_image': 2.0,
+        'qr_modules': 2.0,
+        'mask_sheet_image': 2.0,
+        'process_steps': 3.0,
+        'steps_animation': 5.0,
+        'api_qr': 15.0,
+        # Streams one code at a time without a deadline
+        'generate_zip': None,
+    },
+    # Worker processes and threads per worker used by serve()
+    'QR_WORKERS': os.cpu_count() or 1,
+    'QR_THREADS': 2,
+    # Threads of the shared pool that encodes multi-image responses (walkthrough) in parallel
+    'QR_PNG_THREADS': min(8, os.cpu_count() or 1),
+    # Threads running the views when the app is served over ASGI (asgi.py)
+    'QR_ASGI_THREADS': 32,
+    # Address served by serve()
+    'QR_HOST': '127.0.0.1',
+    'QR_PORT': 5000,
+}
+
+# View functions registered on every app made by create_app(): (rule, view, options)
+_routes = []
+
+def route(rule, **options):
+    """
+    Register a view function for create_app(); used like Flask's app.route.
+    """
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+# Bump whenever rendering changes so that cached images and ETags are not reused
+RENDER_REVISION = 1
+
+# Content types of the image endpoint formats
+IMAGE_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
 
 # Step descriptions for QR code construction process (for web demo)
 STEP_DESCRIPTIONS = [
@@ -36,25 +131,679 @@ STEP_DESCRIPTIONS = [
     "Step 5: Apply Masking<br><b>Explanation:</b> Masking modifies the QR code's modules using one of eight patterns to avoid problematic patterns (like large blocks of the same color) that could confuse scanners. The best mask is chosen based on penalty scores to maximize readability and robustness."
 ]
 
+# ===== Web: Admission Control =====
+class Overloaded(Exception):
+    """
+    Raised when no render slot can be had; answered with 503 and Retry-After.
+    """
+
+class RenderLimiter:
+    """
+    Bounded concurrency for cold (uncached) work: at most `limit` holders at once,
+    at most `queue` waiting, each for up to `timeout` seconds.
+    """
+    def __init__(self, limit, queue, timeout):
+        self.queue = queue
+        self.timeout = timeout
+        self.waiting = 0
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def slot(self, block=False, deadline=None):
+        """
+        Hold a render slot for the duration of the with block.
+        Raises Overloaded if the queue is full or the wait times out, and DeadlineExceeded
+        if the deadline passes first; block=True waits as long as needed and does not count
+        against the queue.
+        """
+        if block:
+            self._slots.acquire()
+        elif not self._slots.acquire(blocking=False):
+            # An expired request is reported as timed out (504), not as overload (503)
+            qr_generator_version2.check_deadline(deadline)
+            timeout = self.timeout
+            if deadline is not None:
+                timeout = max(0.0, min(timeout, deadline - time.monotonic()))
+            with self._lock:
+                if self.waiting >= self.queue:
+                    raise Overloaded()
+                self.waiting += 1
+            try:
+                acquired = self._slots.acquire(timeout=timeout)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+            if not acquired:
+                qr_generator_version2.check_deadline(deadline)
+                raise Overloaded()
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller computes,
+    the others wait for its result (or exception) instead of repeating the work.
+    """
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event()}
+            else:
+                self.coalesced += 1
+        if not leader:
+            call['done'].wait()
+            if 'error' in call:
+                raise call['error']
+            return call['result']
+        try:
+            call['result'] = func(*args)
+            return call['result']
+        except BaseException as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+def single_flight(func):
+    """
+    Decorator coalescing concurrent calls of func with equal arguments (see SingleFlight).
+    Placed under functools.lru_cache, it makes N simultaneous misses of one key render once.
+    """
+    flight = SingleFlight()
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        return flight.do(args, func, *args)
+    wrapper.flight = flight
+    return wrapper
+
+def render_slot():
+    """
+    Render slot of the current app (see RenderLimiter.slot).
+    """
+    return current_app.extensions['qr_limiter'].slot(deadline=request_deadline())
+
+def start_deadline():
+    """
+    Set g.deadline from the endpoint's time budget (before_request hook).
+    """
+    budgets = current_app.config['QR_ROUTE_DEADLINES']
+    budget = budgets.get(request.endpoint, current_app.config['QR_DEADLINE'])
+    if budget is not None:
+        g.deadline = time.monotonic() + budget
+
+def request_deadline():
+    """
+    Deadline of the current request (a time.monotonic() value), or None.
+    """
+    return g.get('deadline')
+
+def build(text):
+    """
+    qr_generator_version2.build_qr, taking a render slot only when the build is not cached.
+    Content over the version 2 capacity is rejected before any work.
+    """
+    qr_generator_version2.pick_version(text)
+    if qr_generator_version2.is_built(text):
+        return qr_generator_version2.build_qr(text)
+    return cold_build(text)
+
+@single_flight
+def cold_build(text):
+    """
+    Uncached build under a render slot; concurrent builds of the same text run once.
+    """
+    with render_slot():
+        return qr_generator_version2.build_qr(text, request_deadline())
+
+def overloaded(error):
+    """
+    Error handler for Overloaded.
+    """
+    return Response("Server busy, please retry.", status=503, mimetype='text/plain',
+                    headers={'Retry-After': str(current_app.config['QR_RETRY_AFTER'])})
+
+def timed_out(error):
+    """
+    Error handler for DeadlineExceeded.
+    """
+    return Response("QR code generation took too long.", status=504, mimetype='text/plain')
+
 # ===== Web: Helper Functions =====
+def b64(data):
+    """
+    Base64-encode image bytes for embedding in the page.
+    """
+    return base64.b64encode(data).decode("ascii")
+
+@functools.lru_cache(maxsize=512)
+@single_flight
+def encoded_step(input_text, step, color, background, scale, mask_id, preset):
+    """
+    Base64 PNG of one construction step, cached per content, style and step.
+    """
+    with render_slot():
+        return b64(generate_step_image(
+            input_text, step, color=color, background=background, scale=scale, mask_id=mask_id,
+            as_png=True, png_preset=preset, deadline=request_deadline()
+        ))
+
+def get_step_image_and_desc(input_text, step, color="#000000", background="#ffffff", scale=10, mask_id=0):
+    """
+    Generate the image and description of a single QR code construction step.
+    Returns a (base64 image, description) tuple; repeated requests are served from the cache.
+    """
+    img_b64 = encoded_step(input_text, step, color, background, scale, mask_id, current_app.config['QR_PNG_PRESET'])
+    return img_b64, STEP_DESCRIPTIONS[step]
+
+@functools.lru_cache(maxsize=128)
+@single_flight
+def encoded_steps(input_text, color, background, scale, mask_id, preset):
+    """
+    Base64 PNGs of all construction steps, encoded together in the shared PNG pool.
+    """
+    with render_slot():
+        return tuple(map(b64, generate_step_images(
+            input_text, color=color, background=background, scale=scale, mask_id=mask_id,
+            as_png=True, png_preset=preset, deadline=request_deadline()
+        )))
+
 def get_step_images_and_desc(input_text, color="#000000", background="#ffffff", scale=10, mask_id=0):
     """
     Generate step-by-step images and descriptions for QR code construction.
     Returns a list of (base64 image, description) tuples.
     """
-    images = generate_step_images(
-        input_text, color=color, background=background, scale=scale, mask_id=mask_id
-    )
-    img_b64_list = []
-    for img in images:
-        buf = io.BytesIO()
-        img.save(buf, format="PNG")
-        img_b64 = base64.b64encode(buf.getvalue()).decode("ascii")
-        img_b64_list.append(img_b64)
-    return list(zip(img_b64_list, STEP_DESCRIPTIONS))
+    images = encoded_steps(input_text, color, background, scale, mask_id, current_app.config['QR_PNG_PRESET'])
+    return list(zip(images, STEP_DESCRIPTIONS))
+
+@functools.lru_cache(maxsize=64)
+@single_flight
+def encoded_animation(input_text, fmt, color, background, scale, mask_id):
+    """
+    Animated GIF or APNG of the whole construction walkthrough, cached per content and style.
+    """
+    with render_slot():
+        return generate_step_images(input_text, color=color, background=background, scale=scale,
+                                    mask_id=mask_id, animation=fmt, deadline=request_deadline())
+
+@functools.lru_cache(maxsize=128)
+@single_flight
+def encoded_sheet(input_text, color, background, preset):
+    """
+    PNG contact sheet of all 8 masks with their scores (see mask_sheet), cached per content and colors.
+    """
+    with render_slot():
+        return mask_sheet(input_text, color=color, background=background, as_png=True, png_preset=preset,
+                          deadline=request_deadline())
+
+@functools.lru_cache(maxsize=64)
+@single_flight
+def encoded_masks(input_text, key, preset):
+    """
+    Base64 PNGs of all 8 masks in one style (keyed on style_key), encoded together in the shared PNG pool.
+    """
+    style = {k: list(v) if isinstance(v, tuple) else v for k, v in key}
+    with render_slot():
+        return tuple(map(b64, qr_generator_version2.generate_qr_code2(
+            input_text, as_png=True, png_preset=preset, deadline=request_deadline(), **style
+        )[0]))
+
+def style_from(source):
+    """
+    Read the version 2 style options from a form, query string or JSON object.
+    Returns keyword arguments for generate_qr_code2 / qr_img; raises ValueError for invalid options.
+    """
+    style = {
+        'color': source.get('color', '#000000'),
+        'background': source.get('background', '#ffffff'),
+        'scale': int(source.get('scale', 10)),
+        'border_width': int(source.get('border_width', 4)),
+        'border_color': source.get('border_color', '#000000'),
+        'gradient_type': source.get('gradient_type', 'none'),
+        'gradient_colors': [
+            source.get('gradient_color1', '#FF0000'),
+            source.get('gradient_color2', '#0000FF')
+        ]
+    }
+    # JSON input can carry numbers or lists where colors are expected
+    names = [style['color'], style['background'], style['border_color'], style['gradient_type'],
+             *style['gradient_colors']]
+    if not all(isinstance(name, str) for name in names):
+        raise ValueError("Colors and gradient type must be strings.")
+    return style
+
+def fit_scale(version, scale, border_width=4, gradient=False, images=1):
+    """
+    Check the projected memory of a render against QR_MAX_RENDER_BYTES before rendering it.
+    Returns the scale, lowered to fit when QR_OVERSIZE is 'downscale'; raises ValueError otherwise.
+    The render itself is freed with the request; what stays cached is bounded separately
+    by QR_RENDER_CACHE_BYTES, so the limit holds per request rather than per cache entry.
+    """
+    limit = current_app.config['QR_MAX_RENDER_BYTES']
+    budget = qr_generator_version2.render_budget(version, scale, border_width, gradient, images)[1]
+    if budget > limit:
+        fitted = 0
+        if current_app.config['QR_OVERSIZE'] == 'downscale':
+            fitted = qr_generator_version2.max_render_scale(version, border_width, limit, gradient, images)
+        if fitted < 1:
+            raise ValueError(f"Image too large: rendering needs about {budget >> 20} MB, "
+                             f"the limit is {limit >> 20} MB.")
+        scale = fitted
+        budget = qr_generator_version2.render_budget(version, scale, border_width, gradient, images)[1]
+    g.render_bytes = g.get('render_bytes', 0) + budget
+    return scale
+
+def fit_style(version, style):
+    """
+    Style with its scale checked by fit_scale.
+    """
+    scale = fit_scale(version, style['scale'], style['border_width'], style['gradient_type'] != 'none')
+    return dict(style, scale=scale)
+
+def fit_step_scale(text, scale):
+    """
+    Scale of the construction step images checked by fit_scale; all stages stay cached together.
+    """
+    version = qr_generator_version2.pick_version(text)
+    return fit_scale(version, scale, STEP_BORDER, images=STEP_COUNT)
+
+def mask_from(source, default=None):
+    """
+    Read the optional mask index (0-7) from a form or query string; raises ValueError if invalid.
+    """
+    value = source.get('mask')
+    if value is None:
+        return default
+    mask_id = int(value)
+    if not 0 <= mask_id < len(qr_generator_version2.masks):
+        raise ValueError(f"Mask must be between 0 and {len(qr_generator_version2.masks) - 1}.")
+    return mask_id
+
+def style_key(style):
+    """
+    Turn style options into a hashable, canonical key.
+    """
+    return tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in style.items()))
+
+def image_etag(fmt, text, style, mask_id=None):
+    """
+    Deterministic ETag of an image, computed from its content and style without rendering it.
+    """
+    key = (RENDER_REVISION, fmt, current_app.config['QR_PNG_PRESET'], text, mask_id, style_key(style))
+    return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+def image_url(fmt, text, style, mask_id=None):
+    """
+    URL of the /qr.png or /qr.svg endpoint for a QR code.
+    """
+    args = {k: v for k, v in style.items() if k != 'gradient_colors'}
+    args['gradient_color1'], args['gradient_color2'] = style['gradient_colors']
+    if mask_id is not None:
+        args['mask'] = mask_id
+    return url_for('qr_image', fmt=fmt, text=text, **args)
+
+def cached_response(etag, produce, mimetype=None):
+    """
+    Response for an immutable resource with a long cache lifetime: 304 if If-None-Match
+    matches etag, otherwise produce() (bytes or a Response). ValueError and IndexError
+    raised by produce() are answered with 400.
+    """
+    headers = {'Cache-Control': f"public, max-age={current_app.config['QR_IMAGE_MAX_AGE']}, immutable"}
+    # Weak comparison (RFC 7232), so tags marked W/ by compressing proxies still match
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304, headers=headers)
+    else:
+        try:
+            data = produce()
+        except (ValueError, IndexError) as e:
+            abort(400, str(e))
+        if isinstance(data, Response):
+            response = data
+            response.headers.update(headers)
+        else:
+            response = Response(data, mimetype=mimetype, headers=headers)
+    response.set_etag(etag)
+    return response
+
+def encode_image(fmt, text, style, mask_id=None, preset='balanced', deadline=None):
+    """
+    Render a version 2 QR code and return the PNG or SVG bytes.
+    """
+    if fmt == 'svg':
+        return qr_svg(text, mask_id=mask_id, deadline=deadline, **style).encode('utf-8')
+    return qr_img_v2(text, mask_id=mask_id, as_png=True, png_preset=preset, deadline=deadline, **style)
+
+@functools.lru_cache(maxsize=256)
+@single_flight
+def render_image(fmt, text, key, mask_id, preset):
+    """
+    Cached encode_image keyed on style_key(style), for the image endpoint and the API.
+    Only misses take a render slot.
+    """
+    style = {k: list(v) if isinstance(v, tuple) else v for k, v in key}
+    with render_slot():
+        return encode_image(fmt, text, style, mask_id, preset, request_deadline())
+
+class ZipStream:
+    """
+    Write-only, non-seekable file object collecting zipfile output until it is popped.
+    zipfile then writes data descriptors instead of seeking back, so the archive
+    can be sent to the client entry by entry.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def read_contents(source, filename):
+    """
+    Yield the contents listed in an uploaded file: the first column of a .csv file,
+    or every line of a text file. Blank entries are skipped. Bytes that are not UTF-8
+    are replaced with U+FFFD, so decoding never fails halfway through the response.
+    """
+    lines = io.TextIOWrapper(source, encoding='utf-8-sig', errors='replace', newline='')
+    if (filename or '').lower().endswith('.csv'):
+        rows = (row[0] if row else '' for row in csv.reader(lines))
+    else:
+        rows = (line.rstrip('\r\n') for line in lines)
+    for text in rows:
+        if text.strip():
+            yield text
+
+def modules_data(builder):
+    """
+    Matrix of a build as packed module bits (base64, row-major, MSB first) plus its metadata.
+    This is what static/qr_canvas.js needs to draw the code in the browser.
+    """
+    return {
+        'version': builder.version,
+        'size': len(builder.code),
+        'best_mask': builder.best_mask,
+        'modules': b64(qr_generator_version2.pack_modules(builder.code)),
+    }
+
+def api_item(item):
+    """
+    Process one /api/qr item and return its JSON result.
+    Only the (cached) build is needed for 'bits' output; images go through render_image.
+    """
+    if not isinstance(item, dict):
+        return {'error': "Each item must be a JSON object."}
+    text = item.get('text')
+    if not text or not isinstance(text, str):
+        return {'error': "Please input URL or Text."}
+    output = item.get('output', 'bits')
+
+    try:
+        style = style_from(item)
+        builder = build(text)
+        count_code(builder.version, builder.best_mask)
+        result = {
+            'text': text,
+            'version': builder.version,
+            'size': len(builder.code),
+            'best_mask': builder.best_mask,
+            'scores': builder.scores,
+        }
+        if output == 'bits':
+            result['modules'] = modules_data(builder)['modules']
+        elif output in IMAGE_TYPES:
+            if output == 'png':
+                style = fit_style(builder.version, style)
+            data = render_image(output, text, style_key(style), None, current_app.config['QR_PNG_PRESET'])
+            result['content_type'] = IMAGE_TYPES[output]
+            result['image'] = b64(data)
+        elif output == 'url':
+            result['url'] = image_url('png', text, style)
+            result['svg_url'] = image_url('svg', text, style)
+        else:
+            return {'error': f"{output} is not a valid output."}
+    except (ValueError, TypeError) as e:
+        return {'error': str(e)}
+    return result
+
+# ===== Web: Metrics =====
+# Kept in process memory; with several worker processes each one reports its own figures.
+# Request latency bucket bounds in seconds, and response size bucket bounds in bytes
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+# Memory bucket bounds in bytes
+MEMORY_BUCKETS = (1 << 20, 4 << 20, 16 << 20, 64 << 20, 256 << 20, 1 << 30)
+
+# Sections reported as a label; anything else is reported as 'other'
+SECTIONS = ('version1', 'version2', 'principle')
+
+class Histogram:
+    """
+    Thread-safe fixed-bucket histogram per label tuple.
+    """
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            hist = self._data.get(labels)
+            if hist is None:
+                hist = self._data[labels] = [0, 0, [0] * (len(self.bounds) + 1)]
+            hist[0] += 1
+            hist[1] += value
+            hist[2][i] += 1
+
+    def samples(self):
+        """
+        Yield (labels, count, sum, {upper bound: cumulative count}) for every label tuple.
+        """
+        bounds = self.bounds + (float('inf'),)
+        with self._lock:
+            items = [(labels, count, total, list(counts)) for labels, (count, total, counts) in self._data.items()]
+        for labels, count, total, counts in items:
+            yield labels, count, total, dict(zip(bounds, itertools.accumulate(counts)))
+
+_metrics_lock = threading.Lock()
+# (endpoint, section, status) -> requests
+request_counts = Counter()
+# (endpoint, section) -> failed generations, including errors shown on the page with status 200
+error_counts = Counter()
+# (version, mask) -> generated codes
+code_counts = Counter()
+# (endpoint, section) -> seconds until the response is returned
+request_latency = Histogram(LATENCY_BUCKETS)
+# (endpoint,) -> body bytes of non-streamed responses
+response_sizes = Histogram(SIZE_BUCKETS)
+# (endpoint,) -> projected render memory (see fit_scale)
+render_budgets = Histogram(MEMORY_BUCKETS)
+# (endpoint, section) -> peak Python allocations above the start of the request (QR_TRACEMALLOC)
+request_memory = Histogram(MEMORY_BUCKETS)
+
+def request_section():
+    """
+    Section label of the current request ('' for routes without sections).
+    """
+    if request.endpoint == 'generate_qr':
+        section = request.form.get('active_section', 'version2')
+    elif request.endpoint == 'home':
+        section = request.args.get('section', 'version2')
+    elif request.endpoint == 'process_steps':
+        section = 'principle'
+    else:
+        return ''
+    return section if section in SECTIONS else 'other'
+
+def count_code(version, mask):
+    """
+    Count a generated QR code by version and mask.
+    """
+    with _metrics_lock:
+        code_counts[(version, mask)] += 1
+
+def count_error(endpoint, section):
+    """
+    Count a failed generation.
+    """
+    with _metrics_lock:
+        error_counts[(endpoint, section if section in SECTIONS else 'other')] += 1
+
+def start_timer():
+    g.start_time = time.perf_counter()
+    if tracemalloc.is_tracing():
+        # The peak is process-wide, so concurrent requests in other threads add to it
+        tracemalloc.reset_peak()
+        g.traced_start = tracemalloc.get_traced_memory()[0]
+
+def record_request(response):
+    """
+    Record count, latency and size of the finished request (after_request hook).
+    """
+    endpoint = request.endpoint or 'unknown'
+    section = request_section()
+    with _metrics_lock:
+        request_counts[(endpoint, section, response.status_code)] += 1
+        if response.status_code >= 500:
+            error_counts[(endpoint, section)] += 1
+    if 'start_time' in g:
+        request_latency.observe((endpoint, section), time.perf_counter() - g.start_time)
+    # Measuring a streamed body would render and buffer all of it here (e.g. /generate_zip)
+    if not (response.is_streamed or response.direct_passthrough):
+        size = response.calculate_content_length()
+        if size is not None:
+            response_sizes.observe((endpoint,), size)
+    if 'render_bytes' in g:
+        render_budgets.observe((endpoint,), g.render_bytes)
+    if 'traced_start' in g and tracemalloc.is_tracing():
+        request_memory.observe((endpoint, section), max(0, tracemalloc.get_traced_memory()[1] - g.traced_start))
+    return response
+
+def metric_labels(names, values):
+    """
+    Format a Prometheus label set.
+    """
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+def metric_lines(name, kind, doc, samples):
+    """
+    Prometheus text lines of one metric; samples are (label names, label values, value).
+    """
+    lines = [f'# HELP {name} {doc}', f'# TYPE {name} {kind}']
+    lines.extend(f'{name}{metric_labels(names, values)} {value}' for names, values, value in samples)
+    return lines
+
+def histogram_lines(name, doc, names, samples):
+    """
+    Prometheus text lines of a histogram; samples are (label values, count, sum, cumulative buckets).
+    """
+    lines = [f'# HELP {name} {doc}', f'# TYPE {name} histogram']
+    for values, count, total, buckets in samples:
+        for bound, n in buckets.items():
+            le = '+Inf' if bound == float('inf') else bound
+            lines.append(f'{name}_bucket{metric_labels(names + ("le",), values + (le,))} {n}')
+        lines.append(f'{name}_sum{metric_labels(names, values)} {total}')
+        lines.append(f'{name}_count{metric_labels(names, values)} {count}')
+    return lines
+
+def coalesced_samples():
+    """
+    Calls served by waiting on an identical in-flight computation, per coalesced function.
+    """
+    samples = {func.__name__: func.__wrapped__.flight.coalesced
+               for func in (encoded_step, encoded_steps, render_image, encoded_sheet, encoded_masks, encoded_animation)}
+    samples['cold_build'] = cold_build.flight.coalesced
+    return samples
+
+def cache_samples():
+    """
+    Hit/miss counters and sizes of the generator caches and the app's encoded-image caches.
+    """
+    stats = {f'qr_{name}': info for name, info in qr_generator_version2.cache_stats().items()}
+    for func in (encoded_step, encoded_steps, render_image, encoded_sheet, encoded_masks, encoded_animation):
+        info = func.cache_info()
+        stats[func.__name__] = {'hits': info.hits, 'misses': info.misses,
+                                'size': info.currsize, 'maxsize': info.maxsize}
+    return stats
+
+@route('/metrics')
+def metrics():
+    """
+    Serve request, generation, cache and stage timing metrics in Prometheus text format.
+    """
+    with _metrics_lock:
+        requests = sorted(request_counts.items())
+        errors = sorted(error_counts.items())
+        codes = sorted(code_counts.items())
+    caches = cache_samples()
+    stages = qr_generator_version2.timing_snapshot()
+
+    lines = []
+    lines += metric_lines('qr_requests_total', 'counter', 'Requests by endpoint, section and status.',
+                          [(('endpoint', 'section', 'status'), key, n) for key, n in requests])
+    lines += histogram_lines('qr_request_duration_seconds', 'Time until the response is returned.',
+                             ('endpoint', 'section'), request_latency.samples())
+    lines += histogram_lines('qr_response_bytes', 'Body size of non-streamed responses.',
+                             ('endpoint',), response_sizes.samples())
+    lines += histogram_lines('qr_render_budget_bytes', 'Projected memory of the images rendered per request.',
+                             ('endpoint',), render_budgets.samples())
+    lines += histogram_lines('qr_request_peak_bytes', 'Peak Python allocations per request (QR_TRACEMALLOC).',
+                             ('endpoint', 'section'), request_memory.samples())
+    lines += metric_lines('qr_errors_total', 'counter', 'Failed requests and generations by endpoint and section.',
+                          [(('endpoint', 'section'), key, n) for key, n in errors])
+    lines += metric_lines('qr_codes_total', 'counter', 'Generated QR codes by version and mask.',
+                          [(('version', 'mask'), key, n) for key, n in codes])
+    lines += metric_lines('qr_cache_hits_total', 'counter', 'Cache hits.',
+                          [(('cache',), (name,), info['hits']) for name, info in caches.items()])
+    lines += metric_lines('qr_cache_misses_total', 'counter', 'Cache misses.',
+                          [(('cache',), (name,), info['misses']) for name, info in caches.items()])
+    lines += metric_lines('qr_cache_hit_ratio', 'gauge', 'Share of cache lookups that hit.',
+                          [(('cache',), (name,), info['hits'] / max(1, info['hits'] + info['misses']))
+                           for name, info in caches.items()])
+    lines += metric_lines('qr_cache_entries', 'gauge', 'Entries currently cached.',
+                          [(('cache',), (name,), info['size']) for name, info in caches.items()])
+    lines += metric_lines('qr_coalesced_total', 'counter', 'Calls that shared an identical in-flight computation.',
+                          [(('func',), (name,), n) for name, n in coalesced_samples().items()])
+    lines += histogram_lines('qr_stage_duration_seconds', 'Generator stage durations (QR_STAGE_TIMING).',
+                             ('stage',), [((stage,), h['count'], h['sum'], h['buckets'])
+                                          for stage, h in sorted(stages.items())])
+    if 'QR_WARMUP_SECONDS' in current_app.config:
+        lines += metric_lines('qr_warmup_seconds', 'gauge', 'Duration of the startup warm-up.',
+                              [((), (), current_app.config['QR_WARMUP_SECONDS'])])
+    return Response('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
 
 # ===== Web: Route Definitions =====
-@app.route('/')
+@route('/')
 def home():
     """
     Home page route. Shows the main interface and optionally the QR construction steps.
@@ -66,7 +815,7 @@ def home():
         step_images = get_step_images_and_desc("Hello QR!", "#000000", "#ffffff", 10, 0)
     return render_template('index.html', active_section=active_section, step_images=step_images)
 
-@app.route('/generate', methods=['POST'])
+@route('/generate', methods=['POST'])
 def generate_qr():
     """
     Handle QR code generation requests from the web form.
@@ -84,10 +833,9 @@ def generate_qr():
     try:
         if active_section == 'version1':
             # Generate QR code using version 1 algorithm
-            qr_image = qr_img_v1(input_text, debug=True)
-            buffered = io.BytesIO()
-            qr_image.save(buffered, format="PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode("ascii")
+            with render_slot():
+                img_str = b64(qr_img_v1(input_text, as_png=True))
+            count_code(1, 0)
             return render_template('index.html',
                                    qr_image=img_str,
                                    input_text=input_text,
@@ -96,38 +844,47 @@ def generate_qr():
 
         elif active_section == 'version2':
             # Generate QR code using version 2 algorithm with style options
-            params = {
-                'color': request.form.get('color', '#000000'),
-                'background': request.form.get('background', '#ffffff'),
-                'scale': int(request.form.get('scale', 10)),
-                'border_width': int(request.form.get('border_width', 4)),
-                'border_color': request.form.get('border_color', '#000000'),
-                'gradient_type': request.form.get('gradient_type', 'none'),
-                'gradient_colors': [
-                    request.form.get('gradient_color1', '#FF0000'),
-                    request.form.get('gradient_color2', '#0000FF')
-                ]
-            }
-            mask_images, mask_scores, best_mask, version_info = generate_qr_code2(
-                input_text,
-                return_version=True,
-                **params
-            )
-
-            # Only show the best mask QR code
-            buffered = io.BytesIO()
-            mask_images[best_mask].save(buffered, format="PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode("ascii")
-
-            # Show all masks and scores if requested
+            params = style_from(request.form)
+            if request.form.get('render') == 'client':
+                # Client-side rendering: only the matrix is sent, the page draws it with qr_canvas.js
+                builder = build(input_text)
+                count_code(builder.version, builder.best_mask)
+                return render_template(
+                    'index.html',
+                    qr_modules=modules_data(builder),
+                    input_text=input_text,
+                    active_section=active_section,
+                    form_data=request.form,
+                    data_length=len(input_text.encode('utf-8')),
+                    qr_version=builder.version
+                )
+            inline = current_app.config['QR_INLINE_IMAGES']
+            preset = current_app.config['QR_PNG_PRESET']
+            builder = build(input_text)
+            mask_scores, best_mask, version_info = builder.scores, builder.best_mask, builder.version
+            params = fit_style(version_info, params)
+            count_code(version_info, best_mask)
+
+            # Only render the best mask QR code; in URL mode the page loads it from the image endpoint
+            img_str = b64(render_image('png', input_text, style_key(params), None, preset)) if inline else None
+
+            # Show all masks and scores if requested, drawn together on one contact sheet
             masks_data = []
+            sheet_str = sheet_url = None
             if show_masks:
-                for idx, (img, score) in enumerate(zip(mask_images, mask_scores)):
-                    buf = io.BytesIO()
-                    img.save(buf, format="PNG")
-                    img_b64 = base64.b64encode(buf.getvalue()).decode("ascii")
+                colors = {'color': params['color'], 'background': params['background']}
+                mask_imgs = [None] * len(mask_scores)
+                if inline and not current_app.config['QR_INLINE_MASK_IMAGES']:
+                    sheet_str = b64(encoded_sheet(input_text, colors['color'], colors['background'], preset))
+                elif inline:
+                    mask_style = dict(params, scale=fit_scale(version_info, params['scale'], params['border_width'],
+                                                              params['gradient_type'] != 'none', len(mask_scores)))
+                    mask_imgs = encoded_masks(input_text, style_key(mask_style), preset)
+                sheet_url = url_for('mask_sheet_image', text=input_text, **colors)
+                for idx, score in enumerate(mask_scores):
                     masks_data.append({
-                        'img': img_b64,
+                        'img': mask_imgs[idx],
+                        'url': image_url('png', input_text, params, idx),
                         'score': sum(score),
                         'idx': idx,
                         'is_best': (idx == best_mask)
@@ -136,12 +893,16 @@ def generate_qr():
             return render_template(
                 'index.html',
                 qr_image=img_str,
+                qr_url=image_url('png', input_text, params),
+                qr_svg_url=image_url('svg', input_text, params),
                 input_text=input_text,
                 active_section=active_section,
                 form_data=request.form,
                 data_length=len(input_text.encode('utf-8')),
                 qr_version=version_info,
                 masks_data=masks_data if show_masks else None,
+                mask_sheet=sheet_str,
+                mask_sheet_url=sheet_url,
                 show_masks=show_masks
             )
 
@@ -149,20 +910,167 @@ def generate_qr():
             # Support custom input for process steps demo
             color = request.form.get('color', '#000000')
             background = request.form.get('background', '#ffffff')
-            scale = int(request.form.get('scale', 10))
+            scale = fit_step_scale(input_text, int(request.form.get('scale', 10)))
             step_images = get_step_images_and_desc(input_text, color, background, scale, 0)
             return render_template('index.html',
                                    active_section=active_section,
                                    input_text=input_text,
                                    step_images=step_images)
 
+    except (Overloaded, DeadlineExceeded):
+        raise
     except Exception as e:
         # Handle errors and display error message on the web page
+        count_error('generate_qr', active_section)
         return render_template('index.html',
                                error=f"Failure: {str(e)}",
                                active_section=active_section)
 
-@app.route('/process_steps', methods=['POST'])
+@route('/qr.json')
+def qr_modules():
+    """
+    Serve only the matrix of a QR code (see modules_data) for drawing on a canvas.
+    The result depends on the text alone, so style changes need no further request.
+    """
+    text = request.args.get('text')
+    if not text:
+        abort(400, "Missing text parameter.")
+    return cached_response(image_etag('json', text, {}), lambda: jsonify(modules_data(build(text))))
+
+@route('/qr.<fmt>')
+def qr_image(fmt):
+    """
+    Serve a version 2 QR code as raw PNG or SVG bytes.
+    Query parameters are the version 2 form fields (text, color, background, scale,
+    border_width, border_color, gradient_type, gradient_color1/2) plus an optional mask index.
+    Responses carry a deterministic ETag and a long cache lifetime; a matching
+    If-None-Match is answered with 304 before anything is rendered.
+    """
+    if fmt not in IMAGE_TYPES:
+        abort(404)
+    text = request.args.get('text')
+    if not text:
+        abort(400, "Missing text parameter.")
+    try:
+        style = style_from(request.args)
+        mask_id = mask_from(request.args)
+    except ValueError:
+        abort(400, "Invalid style parameter.")
+    if fmt == 'png':
+        # SVG output does not grow with the scale
+        try:
+            style = fit_style(qr_generator_version2.pick_version(text), style)
+        except ValueError as e:
+            abort(400, str(e))
+
+    preset = current_app.config['QR_PNG_PRESET']
+    return cached_response(image_etag(fmt, text, style, mask_id),
+                           lambda: render_image(fmt, text, style_key(style), mask_id, preset),
+                           IMAGE_TYPES[fmt])
+
+@route('/masks.png')
+def mask_sheet_image():
+    """
+    Serve the contact sheet of all 8 masks of a version 2 QR code with their penalty scores.
+    Query parameters: text, color and background. Cached like /qr.<fmt>.
+    """
+    text = request.args.get('text')
+    if not text:
+        abort(400, "Missing text parameter.")
+    color = request.args.get('color', '#000000')
+    background = request.args.get('background', '#ffffff')
+
+    preset = current_app.config['QR_PNG_PRESET']
+    return cached_response(image_etag('masks', text, {'color': color, 'background': background}),
+                           lambda: encoded_sheet(text, color, background, preset), 'image/png')
+
+@route('/api/qr', methods=['POST'])
+def api_qr():
+    """
+    JSON API for programmatic and batch generation.
+    The body is one item or an array of items; each item has a 'text', an optional
+    'output' ('bits' (default), 'png', 'svg' or 'url') and the version 2 style fields.
+    Results hold the version, best mask and per-rule penalty scores of every mask,
+    plus the packed modules (base64, row-major, MSB first), the base64 image or its URLs.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, (dict, list)):
+        return jsonify(error="Expected a JSON object or array."), 400
+    if isinstance(payload, dict):
+        result = api_item(payload)
+        return jsonify(result), (400 if 'error' in result else 200)
+    if len(payload) > current_app.config['QR_API_MAX_BATCH']:
+        return jsonify(error=f"At most {current_app.config['QR_API_MAX_BATCH']} items per request."), 413
+    return jsonify([api_item(item) for item in payload])
+
+@route('/generate_zip', methods=['POST'])
+def generate_zip():
+    """
+    Bulk generation: render every content of an uploaded CSV/text file with the shared
+    version 2 style options and stream the codes back as a ZIP archive.
+    Each code is sent as soon as it is rendered, so the archive is never held in memory.
+    Contents that cannot be encoded are listed in errors.txt at the end of the archive.
+    """
+    upload = request.files.get('file')
+    if upload is None:
+        abort(400, "Please upload a CSV or text file.")
+    fmt = request.form.get('format', 'png')
+    if fmt not in IMAGE_TYPES:
+        abort(400, f"{fmt} is not a valid format.")
+    try:
+        style = style_from(request.form)
+        # Checked once here, as a bad color would otherwise fail every code of the archive
+        for name in ('color', 'background', 'border_color'):
+            qr_generator_version2.color_to_rgb(style[name])
+        if style['gradient_type'] != 'none':
+            for color in style['gradient_colors']:
+                qr_generator_version2.hex_to_rgb(color)
+    except ValueError:
+        abort(400, "Invalid style parameter.")
+    if fmt == 'png':
+        # Checked once for version 2, the largest code any content can produce
+        try:
+            style = fit_style(2, style)
+        except ValueError as e:
+            abort(400, str(e))
+    # Uploaded files are closed with the request, before the response is streamed
+    source = tempfile.SpooledTemporaryFile(max_size=1 << 20)
+    upload.save(source)
+    source.seek(0)
+    preset = current_app.config['QR_PNG_PRESET']
+    max_items = current_app.config['QR_ZIP_MAX_ITEMS']
+    limiter = current_app.extensions['qr_limiter']
+    # PNG data is already compressed, SVG text is not
+    compression = zipfile.ZIP_DEFLATED if fmt == 'svg' else zipfile.ZIP_STORED
+
+    def generate():
+        stream = ZipStream()
+        errors = []
+        with source, zipfile.ZipFile(stream, 'w', compression) as zf:
+            for idx, text in enumerate(read_contents(source, upload.filename), 1):
+                if idx > max_items:
+                    errors.append(f"Only the first {max_items} contents were generated.")
+                    break
+                if '\ufffd' in text:
+                    errors.append(f"{idx}: not valid UTF-8 text")
+                    continue
+                try:
+                    # Each code waits for its own slot, so other requests get turns between codes
+                    with limiter.slot(block=True):
+                        data = encode_image(fmt, text, style, preset=preset)
+                except ValueError as e:
+                    errors.append(f"{idx}: {e}")
+                    continue
+                zf.writestr(f"{idx:05d}.{fmt}", data)
+                yield stream.pop()
+            if errors:
+                zf.writestr('errors.txt', '\n'.join(errors))
+        yield stream.pop()
+
+    return Response(generate(), mimetype='application/zip',
+                    headers={'Content-Disposition': 'attachment; filename="qrcodes.zip"'})
+
+@route('/process_steps', methods=['POST'])
 def process_steps():
     """
     Handle AJAX requests for step-by-step QR code construction images.
@@ -173,374 +1081,154 @@ def process_steps():
     background = request.form.get('background', '#ffffff')
     scale = int(request.form.get('scale', 10))
     step = int(request.form.get('step', 0))  # Current step index
-    step_images = get_step_images_and_desc(input_text, color, background, scale, 0)
-    # Only return the current step
+    # Only render the current step
     if step < 0: step = 0
-    if step >= len(step_images): step = len(step_images) - 1
-    current_img, current_desc = step_images[step]
+    if step >= STEP_COUNT: step = STEP_COUNT - 1
+    try:
+        scale = fit_step_scale(input_text, scale)
+    except ValueError as e:
+        abort(400, str(e))
+    current_img, current_desc = get_step_image_and_desc(input_text, step, color, background, scale, 0)
     return render_template('index.html',
                            active_section='principle',
                            input_text=input_text,
                            step_img=current_img,
                            step_desc=current_desc,
                            step=step,
-                           total_steps=len(step_images),
+                           total_steps=STEP_COUNT,
                            color=color,
                            background=background,
                            scale=scale)
 
-# ===== Desktop GUI Code (Mainly for Demo, Web is the Main Presentation) =====
-
-class QRCodeGUI:
+@route('/steps.<fmt>')
+def steps_animation(fmt):
     """
-    Simple desktop GUI for QR code generation (version 1).
+    Serve the whole construction walkthrough as one animated GIF or APNG.
+    Query parameters: text, color, background, scale and mask. Cached like /qr.<fmt>.
     """
-    def __init__(self, root):
-        self.root = root
-        self.root.title("QR Code Generator")
-
-        self.label = tk.Label(root, text="Enter URL or Text:")
-        self.label.pack()
-
-        self.entry = tk.Entry(root, width=50)
-        self.entry.pack()
-
-        self.gen_btn = tk.Button(root, text="Generate QR Code", command=self.gen_qr)
-        self.gen_btn.pack()
-
-        self.image_label = tk.Label(root)
-        self.image_label.pack()
-
-        self.warning_label = tk.Label(
-            root,
-            text="Warning: Do not scan QR codes from unknown sources to avoid phishing and other security risks.",
-            fg="red",
-            wraplength=400,
-            justify="center"
-        )
-        self.warning_label.pack()
-
-    def gen_qr(self):
-        """
-        Generate QR code and display in the GUI.
-        """
-        input_string = self.entry.get()
-
-        if not input_string:
-            messagebox.showerror("Error", "Please enter a URL or text.")
-            return
-
-        try:
-            # Generate QR code image using the generator module
-            qr_image = qr_img_v1(input_string, debug=True)
-            img_tk = ImageTk.PhotoImage(qr_image)
-            self.image_label.config(image=img_tk)
-            self.image_label.image = img_tk  # Prevent image from being garbage collected
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to generate QR code: {e}")
-
-
-class QRCodeGeneratorGUI:
-    """
-    Advanced desktop GUI for QR code generation (version 2, with style options).
-    """
-    def __init__(self, root):
-        self.root = root
-        self.root.title("QR Code Generator")
-        self.root.geometry("800x600")
-        self.root.minsize(420, 520)
-
-        # Input area
-        input_frame = ttk.Frame(root)
-        input_frame.pack(pady=10, fill=tk.X)
-
-        ttk.Label(input_frame, text="Enter URL or Text:").grid(row=0, column=0, sticky="e")
-        self.entry = ttk.Entry(input_frame, width=40)
-        self.entry.grid(row=0, column=1, columnspan=3, padx=5, pady=2)
-
-        # Color settings
-        ttk.Label(input_frame, text="QR Color:").grid(row=1, column=0, sticky="e")
-        self.color_var = tk.StringVar(value="#000000")
-        self.color_entry = ttk.Entry(input_frame, textvariable=self.color_var, width=10)
-        self.color_entry.grid(row=1, column=1, pady=2)
-        ttk.Button(input_frame, text="Pick", command=self.pick_color).grid(row=1, column=2, padx=2)
-
-        ttk.Label(input_frame, text="Background:").grid(row=1, column=3, sticky="e")
-        self.bg_var = tk.StringVar(value="#ffffff")
-        self.background_entry = ttk.Entry(input_frame, textvariable=self.bg_var, width=10)
-        self.background_entry.grid(row=1, column=4, pady=2)
-        ttk.Button(input_frame, text="Pick", command=self.pick_bg_color).grid(row=1, column=5, padx=2)
-
-        ttk.Label(input_frame, text="Scale:").grid(row=2, column=0, sticky="e")
-        self.scale_var = tk.IntVar(value=10)
-        ttk.Spinbox(input_frame, from_=2, to=20, textvariable=self.scale_var, width=5).grid(row=2, column=1, pady=2)
-
-        # Style control area
-        style_frame = ttk.Frame(root)
-        style_frame.pack(pady=5, fill=tk.X)
-
-        ttk.Label(style_frame, text="border width:").grid(row=0, column=0, sticky="e")
-        self.border_var = tk.IntVar(value=4)
-        ttk.Spinbox(style_frame, from_=0, to=20, textvariable=self.border_var, width=5).grid(row=0, column=1, padx=2)
-
-        ttk.Label(style_frame, text="border color:").grid(row=0, column=2, sticky="e")
-        self.border_color_var = tk.StringVar(value="#000000")
-        self.border_color_entry = ttk.Entry(style_frame, textvariable=self.border_color_var, width=10)
-        self.border_color_entry.grid(row=0, column=3, padx=2)
-        ttk.Button(style_frame, text="Pick", command=self.pick_border_color).grid(row=0, column=4, padx=2)
-
-        # Gradient type
-        ttk.Label(style_frame, text="Gradient type:").grid(row=1, column=0, sticky="e")
-        self.gradient_type = tk.StringVar(value="none")
-        ttk.Combobox(style_frame, textvariable=self.gradient_type,
-                     values=["none", "linear", "radial"], width=8).grid(row=1, column=1, columnspan=2)
-
-        ttk.Label(style_frame, text="graduated color:").grid(row=1, column=3, sticky="e")
-        self.gradient_colors = ttk.Entry(style_frame, width=15)
-        self.gradient_colors.insert(0, "#FF0000,#0000FF")
-        self.gradient_colors.grid(row=1, column=4, padx=2)
-        ttk.Button(style_frame, text="Pick1", command=self.pick_gradient_color1).grid(row=1, column=5, padx=2)
-        ttk.Button(style_frame, text="Pick2", command=self.pick_gradient_color2).grid(row=1, column=6, padx=2)
-
-        # Info area
-        self.info_label = ttk.Label(root, text="Data length: 0 bytes | Current version: 2")
-        self.info_label.pack(pady=5)
-
-        # Button area (horizontal)
-        button_frame = ttk.Frame(root)
-        button_frame.pack(pady=10)
-        self.generate_button = ttk.Button(button_frame, text="Generate QR Code", command=self.generate_qr)
-        self.generate_button.pack(side=tk.LEFT, padx=10)
-        self.show_masks_btn = ttk.Button(button_frame, text="Display all masks and scores", command=self.show_all_masks)
-        self.show_masks_btn.pack(side=tk.LEFT, padx=10)
-        self.reset_button = ttk.Button(button_frame, text="Restore Color Option", command=self.reset_colors)
-        self.reset_button.pack(side=tk.LEFT, padx=10)
-        # Preview area
-        self.image_label = ttk.Label(root)
-        self.image_label.pack(pady=10)
-
-        # Warning info
-        self.warning_label = ttk.Label(
-            root,
-            text="Warning: Do not scan QR codes from unknown sources to avoid phishing and other security risks.",
-            foreground="red",
-            wraplength=400,
-            justify="center"
-        )
-        self.warning_label.pack(pady=5)
-
-    def pick_color(self):
-        """
-        Open color picker for QR color.
-        """
-        color = colorchooser.askcolor(title="Pick QR Color")
-        if color[1]:
-            self.color_var.set(color[1])
-
-    def pick_bg_color(self):
-        """
-        Open color picker for background color.
-        """
-        color = colorchooser.askcolor(title="Pick Background Color")
-        if color[1]:
-            self.bg_var.set(color[1])
-
-    def pick_border_color(self):
-        """
-        Open color picker for border color.
-        """
-        color = colorchooser.askcolor(title="Pick Border Color")
-        if color[1]:
-            self.border_color_var.set(color[1])
-
-    def pick_gradient_color1(self):
-        """
-        Open color picker for gradient start color.
-        """
-        color = colorchooser.askcolor(title="Pick Gradient Start Color")
-        if color[1]:
-            colors = self.gradient_colors.get().split(",")
-            if len(colors) == 2:
-                self.gradient_colors.delete(0, tk.END)
-                self.gradient_colors.insert(0, f"{color[1]},{colors[1].strip()}")
-            else:
-                self.gradient_colors.delete(0, tk.END)
-                self.gradient_colors.insert(0, f"{color[1]},#0000FF")
-
-    def pick_gradient_color2(self):
-        """
-        Open color picker for gradient end color.
-        """
-        color = colorchooser.askcolor(title="Pick Gradient End Color")
-        if color[1]:
-            colors = self.gradient_colors.get().split(",")
-            if len(colors) == 2:
-                self.gradient_colors.delete(0, tk.END)
-                self.gradient_colors.insert(0, f"{colors[0].strip()},{color[1]}")
-            else:
-                self.gradient_colors.delete(0, tk.END)
-                self.gradient_colors.insert(0, f"#FF0000,{color[1]}")
-
-    def generate_qr(self):
-        """
-        Generate QR code with current style settings and display in GUI.
-        """
-        input_string = self.entry.get()
-        color = self.color_var.get()
-        background = self.bg_var.get()
-        scale = self.scale_var.get()
-        border_width = self.border_var.get()
-        border_color = self.border_color_var.get()
-        gradient_type = self.gradient_type.get()
-        gradient_colors = [c.strip() for c in self.gradient_colors.get().split(",")]
-
-        if not input_string:
-            messagebox.showerror("Error", "Please enter a URL or text.")
-            return
-
-        try:
-            data_bytes = input_string.encode('utf-8')
-            data_length = len(data_bytes)
-
-            mask_images, mask_scores, best_mask, actual_version = qr_generator_version2.generate_qr_code2(
-                input_string,
-                color=color,
-                background=background,
-                scale=scale,
-                border_width=border_width,
-                border_color=border_color,
-                gradient_type=gradient_type,
-                gradient_colors=gradient_colors,
-                return_version=True
-            )
-
-            self.info_label.config(
-                text=f"data length: {data_length} bytes | current version: {actual_version}"
-            )
-
-            img = mask_images[best_mask]
-            img_tk = ImageTk.PhotoImage(img)
-            self.image_label.config(image=img_tk)
-            self.image_label.image = img_tk
+    if fmt not in ANIMATION_FORMATS:
+        abort(404)
+    text = request.args.get('text', 'Hello QR!')
+    color = request.args.get('color', '#000000')
+    background = request.args.get('background', '#ffffff')
+    try:
+        scale = int(request.args.get('scale', 10))
+        mask_id = mask_from(request.args, 0)
+    except ValueError:
+        abort(400, "Invalid style parameter.")
+    try:
+        scale = fit_step_scale(text, scale)
+    except ValueError as e:
+        abort(400, str(e))
 
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to generate QR code: {e}")
+    style = {'color': color, 'background': background, 'scale': scale}
+    return cached_response(image_etag(fmt, text, style, mask_id),
+                           lambda: encoded_animation(text, fmt, color, background, scale, mask_id),
+                           ANIMATION_FORMATS[fmt][1])
 
-    def show_all_masks(self):
-        """
-        Display all mask patterns and their penalty scores in a popup window.
-        """
-        input_string = self.entry.get()
-        color = self.color_var.get()
-        background = self.bg_var.get()
-        scale = self.scale_var.get()
-        border_width = self.border_var.get()
-        border_color = self.border_color_var.get()
-        gradient_type = self.gradient_type.get()
-        gradient_colors = [c.strip() for c in self.gradient_colors.get().split(",")]
-
-        if not input_string:
-            messagebox.showerror("Error", "Please enter a URL or text.")
-            return
+# ===== Web: App Factory and Server =====
+def create_app(config=None):
+    """
+    Create the Flask app with DEFAULT_CONFIG, environment overrides and the given config.
+    Encoder tables and caches are warmed here, so a pre-fork server that loads the app
+    once in its master process (serve(), or gunicorn --preload) shares them with every
+    worker copy-on-write.
+    """
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    app.config.from_prefixed_env()
+    app.config.update(config or {})
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    if app.config['QR_STAGE_TIMING']:
+        qr_generator_version2.enable_timing()
+    qr_generator_version2.set_png_workers(app.config['QR_PNG_THREADS'])
+    qr_generator_version2.set_render_cache_bytes(app.config['QR_RENDER_CACHE_BYTES'])
+    if app.config['QR_TRACEMALLOC'] and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if app.config['QR_METRICS']:
+        app.before_request(start_timer)
+        app.after_request(record_request)
+    app.extensions['qr_limiter'] = RenderLimiter(app.config['QR_MAX_CONCURRENT_RENDERS'],
+                                                 app.config['QR_RENDER_QUEUE'],
+                                                 app.config['QR_RENDER_QUEUE_TIMEOUT'])
+    app.register_error_handler(Overloaded, overloaded)
+    app.before_request(start_deadline)
+    app.register_error_handler(DeadlineExceeded, timed_out)
+    if app.config['QR_WARMUP']:
+        warm_caches(app)
+    return app
+
+def warm_caches(app):
+    """
+    Precompute encoder tables and render the demo walkthrough so the first requests are fast.
+    Returns the seconds spent, also stored in app.config['QR_WARMUP_SECONDS'].
+    """
+    start = time.perf_counter()
+    with app.app_context():
+        qr_generator_version2.warm_up(app.config['QR_WARMUP_TEXTS'])
+        get_step_images_and_desc("Hello QR!", "#000000", "#ffffff", 10, 0)
+    elapsed = time.perf_counter() - start
+    app.config['QR_WARMUP_SECONDS'] = elapsed
+    app.logger.info("QR warm-up finished in %.1f ms", elapsed * 1000)
+    return elapsed
+
+def serve(app):
+    """
+    Serve the app with QR_WORKERS processes of QR_THREADS threads each.
+    Uses gunicorn when it is installed and falls back to the threaded single-process
+    werkzeug server, since its multi-process mode forks (and discards) a child per
+    request, losing the caches and metrics with it.
+    With DEBUG on, runs the single-process development server with the reloader.
+    """
+    config = app.config
+    if config['DEBUG']:
+        app.run(config['QR_HOST'], config['QR_PORT'], debug=True)
+        return
+    # Move everything built so far out of the collector's reach, so collections in
+    # the workers do not touch (and copy) the pages shared with the master process
+    gc.collect()
+    gc.freeze()
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        if config['QR_WORKERS'] > 1:
+            app.logger.warning("gunicorn is not installed; serving QR_WORKERS=%d as one threaded process",
+                               config['QR_WORKERS'])
+        app.run(config['QR_HOST'], config['QR_PORT'], use_reloader=False, threaded=True)
+        return
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{config['QR_HOST']}:{config['QR_PORT']}")
+            self.cfg.set('workers', config['QR_WORKERS'])
+            self.cfg.set('threads', config['QR_THREADS'])
+            self.cfg.set('preload_app', True)
+
+        def load(self):
+            return app
+
+    Server().run()
+
+# ===== Desktop GUI (gui.py, imported on first use) =====
+# Names re-exported lazily so the web service never loads Tk
+_GUI_NAMES = ('QRCodeGUI', 'QRCodeGeneratorGUI')
+
+def __getattr__(name):
+    """
+    Import the desktop GUI classes from gui.py on first access (PEP 562).
+    """
+    if name in _GUI_NAMES:
+        import gui
+        return getattr(gui, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-        try:
-            mask_images, mask_scores, best_mask, actual_version = qr_generator_version2.generate_qr_code2(
-                input_string,
-                color=color,
-                background=background,
-                scale=scale,
-                border_width=border_width,
-                border_color=border_color,
-                gradient_type=gradient_type,
-                gradient_colors=gradient_colors,
-                return_version=True
-            )
-            # Popup display
-            win = tk.Toplevel(self.root)
-            win.title("All Masks and Scores (Best Mask Highlighted)")
-            for i, (img, scores) in enumerate(zip(mask_images, mask_scores)):
-                img_tk = ImageTk.PhotoImage(img.resize((120, 120), Image.NEAREST))
-                frame = ttk.Frame(win, borderwidth=2, relief="solid" if i == best_mask else "flat")
-                frame.grid(row=i // 4, column=i % 4, padx=5, pady=5)
-                label = ttk.Label(frame, image=img_tk)
-                label.image = img_tk
-                label.pack()
-                score_str = f"Mask {i}\nScore: {sum(scores)} (R1:{scores[0]} R2:{scores[1]} R3:{scores[2]} R4:{scores[3]})"
-                ttk.Label(frame, text=score_str, foreground="red" if i == best_mask else "black").pack()
-            # Slideshow button
-            step_button = ttk.Button(win, text="Show QR Construction Steps",
-                                     command=lambda: self.show_steps(win, input_string, color, background, scale,
-                                                                     best_mask))
-            step_button.grid(row=2, column=0, columnspan=4, pady=10)
-            win.grab_set()
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to display masks: {e}")
-
-    def show_steps(self, mask_window, input_string, color, background, scale, best_mask):
-        """
-        Show a slideshow of QR code construction steps for the selected mask.
-        """
-        mask_window.destroy()
-        step_images = qr_generator_version2.generate_step_images(
-            input_string, color=color, background=background, scale=scale, mask_id=best_mask
-        )
-        step_titles = [
-            "Step 1: Finder Patterns",
-            "Step 2: Finder + Alignment Patterns",
-            "Step 3: Finder + Alignment + Data Bits",
-            "Step 4: Final QR Code (Masked)"
-        ]
-        slide_window = tk.Toplevel(self.root)
-        slide_window.title("QR Code Construction Slideshow")
-        slide_frame = ttk.Frame(slide_window)
-        slide_frame.pack(padx=10, pady=10)
-        img_label = ttk.Label(slide_frame)
-        img_label.pack()
-        title_label = ttk.Label(slide_frame, font=("Arial", 14))
-        title_label.pack(pady=5)
-        state = {'idx': 0}
-        img_tk_list = [ImageTk.PhotoImage(img.resize((300, 300), Image.NEAREST)) for img in step_images]
-
-        def update_slide():
-            idx = state['idx']
-            img_label.config(image=img_tk_list[idx])
-            img_label.image = img_tk_list[idx]
-            title_label.config(text=step_titles[idx])
-
-        def prev_slide():
-            if state['idx'] > 0:
-                state['idx'] -= 1
-                update_slide()
-
-        def next_slide():
-            if state['idx'] < len(step_images) - 1:
-                state['idx'] += 1
-                update_slide()
-
-        btn_frame = ttk.Frame(slide_window)
-        btn_frame.pack(pady=10)
-        prev_btn = ttk.Button(btn_frame, text="Previous", command=prev_slide)
-        prev_btn.grid(row=0, column=0, padx=5)
-        next_btn = ttk.Button(btn_frame, text="Next", command=next_slide)
-        next_btn.grid(row=0, column=1, padx=5)
-
-        update_slide()
-
-    # Restore colors to default values
-    def reset_colors(self):
-        self.color_var.set("#000000")
-        self.bg_var.set("#ffffff")
-        self.border_color_var.set("#000000")
-        self.gradient_type.set("none")
-        self.gradient_colors.delete(0, tk.END)
-        self.gradient_colors.insert(0, "#FF0000,#0000FF")
+# Default app, for `flask run` and WSGI servers pointed at app:app
+app = create_app()
 
 # ===== Main Entry Point =====
 if __name__ == '__main__':
-    # Start Flask web server
-    app.run(debug=True)
+    # Start the web server; set FLASK_DEBUG=true for the development server with the reloader
+    serve(app)
 
-    # To start the desktop GUI, run the following code separately
-    # root = tk.Tk()
-    # app_gui = QRCodeGeneratorGUI(root)
-    # root.mainloop()
\ No newline at end of file
+    # To start the desktop GUI, run `python gui.py` separately
\ No newline at end of file
@@ -0,0 +1,139 @@
+'''
+This code file is the ASGI variant of the Web (app.py), for event-loop servers such as uvicorn:
+Input the command `uvicorn asgi:app --workers 4` in the terminal.
+It serves the same routes as app.py. Connections, request bodies and responses are
+handled on the event loop, so idle or slow clients do not hold a thread; only the
+views themselves run in a thread pool of QR_ASGI_THREADS threads.
+'''
+
+# ===== Imports =====
+from app import app as flask_app
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import sys
+import tempfile
+
+# Request bodies larger than this are spooled to a temporary file
+SPOOL_SIZE = 1024 * 1024
+
+# ===== ASGI Adapter =====
+def wsgi_environ(scope, body, length):
+    """
+    Build the WSGI environ of an ASGI HTTP scope and its received body (a file object of length bytes).
+    """
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        environ[name] = environ[name] + ',' + value if name in environ else value
+    # The whole body has been received, also when it was sent chunked
+    environ['CONTENT_LENGTH'] = str(length)
+    return environ
+
+def start_response(wsgi_app, environ):
+    """
+    Call the WSGI app (in a pool thread) and return its status, headers and body iterator.
+    Bodies of known length are read here in one go; streamed bodies are left to the caller.
+    """
+    started = {}
+
+    def capture(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+    result = wsgi_app(environ, capture)
+    if any(k == b'content-length' for k, _ in started['headers']):
+        try:
+            return started['status'], started['headers'], iter([b''.join(result)])
+        finally:
+            close_body(result)
+    return started['status'], started['headers'], iter(result)
+
+def close_body(result):
+    """
+    Close a WSGI response body if it supports it.
+    """
+    if hasattr(result, 'close'):
+        result.close()
+
+class AsgiApp:
+    """
+    ASGI application running a WSGI (Flask) app's views in a thread pool.
+    """
+    def __init__(self, wsgi_app, threads):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='qr-asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    async def lifespan(self, receive, send):
+        """
+        Acknowledge startup and shut the thread pool down with the server.
+        """
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        """
+        Receive the request body, run the view in the pool and send the response.
+        """
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as body:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            length = body.tell()
+            body.seek(0)
+            loop = asyncio.get_running_loop()
+            status, headers, chunks = await loop.run_in_executor(
+                self.executor, start_response, self.wsgi_app, wsgi_environ(scope, body, length))
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            try:
+                while True:
+                    # Streamed bodies (e.g. /generate_zip) render as they are iterated
+                    chunk = await loop.run_in_executor(self.executor, next, chunks, None)
+                    if chunk is None:
+                        break
+                    if chunk:
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            finally:
+                await loop.run_in_executor(self.executor, close_body, chunks)
+            await send({'type': 'http.response.body', 'body': b''})
+
+# Default app, for ASGI servers pointed at asgi:app
+app = AsgiApp(flask_app, flask_app.config['QR_ASGI_THREADS'])
@@ -0,0 +1,357 @@
+'''
+This code file is the desktop GUI (Tkinter) of the QR code generators.
+If you want to run the desktop demo, please run this file directly:
+Input the command `python gui.py` in the terminal.
+The web service (app.py) does not import this module, so it runs without Tk.
+'''
+
+# ===== Developers =====
+# 31808397_Shen Ruiting finished the Basic GUI/Website Interactivity and Visualization.
+# 31808636_Zhang Enze finished Presentation and Visualisation.
+
+
+# ===== Imports =====
+import tkinter as tk
+from tkinter import messagebox, colorchooser, ttk
+from PIL import Image, ImageTk
+from qr_generator_version1 import qr_img as qr_img_v1
+from qr_generator_version2 import mask_sheet
+import qr_generator_version2
+
+# ===== Desktop GUI Code (Mainly for Demo, Web is the Main Presentation) =====
+
+class QRCodeGUI:
+    """
+    Simple desktop GUI for QR code generation (version 1).
+    """
+    def __init__(self, root):
+        self.root = root
+        self.root.title("QR Code Generator")
+
+        self.label = tk.Label(root, text="Enter URL or Text:")
+        self.label.pack()
+
+        self.entry = tk.Entry(root, width=50)
+        self.entry.pack()
+
+        self.gen_btn = tk.Button(root, text="Generate QR Code", command=self.gen_qr)
+        self.gen_btn.pack()
+
+        self.image_label = tk.Label(root)
+        self.image_label.pack()
+
+        self.warning_label = tk.Label(
+            root,
+            text="Warning: Do not scan QR codes from unknown sources to avoid phishing and other security risks.",
+            fg="red",
+            wraplength=400,
+            justify="center"
+        )
+        self.warning_label.pack()
+
+    def gen_qr(self):
+        """
+        Generate QR code and display in the GUI.
+        """
+        input_string = self.entry.get()
+
+        if not input_string:
+            messagebox.showerror("Error", "Please enter a URL or text.")
+            return
+
+        try:
+            # Generate QR code image using the generator module
+            qr_image = qr_img_v1(input_string, debug=True)
+            img_tk = ImageTk.PhotoImage(qr_image)
+            self.image_label.config(image=img_tk)
+            self.image_label.image = img_tk  # Prevent image from being garbage collected
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to generate QR code: {e}")
+
+
+class QRCodeGeneratorGUI:
+    """
+    Advanced desktop GUI for QR code generation (version 2, with style options).
+    """
+    def __init__(self, root):
+        self.root = root
+        self.root.title("QR Code Generator")
+        self.root.geometry("800x600")
+        self.root.minsize(420, 520)
+
+        # Input area
+        input_frame = ttk.Frame(root)
+        input_frame.pack(pady=10, fill=tk.X)
+
+        ttk.Label(input_frame, text="Enter URL or Text:").grid(row=0, column=0, sticky="e")
+        self.entry = ttk.Entry(input_frame, width=40)
+        self.entry.grid(row=0, column=1, columnspan=3, padx=5, pady=2)
+
+        # Color settings
+        ttk.Label(input_frame, text="QR Color:").grid(row=1, column=0, sticky="e")
+        self.color_var = tk.StringVar(value="#000000")
+        self.color_entry = ttk.Entry(input_frame, textvariable=self.color_var, width=10)
+        self.color_entry.grid(row=1, column=1, pady=2)
+        ttk.Button(input_frame, text="Pick", command=self.pick_color).grid(row=1, column=2, padx=2)
+
+        ttk.Label(input_frame, text="Background:").grid(row=1, column=3, sticky="e")
+        self.bg_var = tk.StringVar(value="#ffffff")
+        self.background_entry = ttk.Entry(input_frame, textvariable=self.bg_var, width=10)
+        self.background_entry.grid(row=1, column=4, pady=2)
+        ttk.Button(input_frame, text="Pick", command=self.pick_bg_color).grid(row=1, column=5, padx=2)
+
+        ttk.Label(input_frame, text="Scale:").grid(row=2, column=0, sticky="e")
+        self.scale_var = tk.IntVar(value=10)
+        ttk.Spinbox(input_frame, from_=2, to=20, textvariable=self.scale_var, width=5).grid(row=2, column=1, pady=2)
+
+        # Style control area
+        style_frame = ttk.Frame(root)
+        style_frame.pack(pady=5, fill=tk.X)
+
+        ttk.Label(style_frame, text="border width:").grid(row=0, column=0, sticky="e")
+        self.border_var = tk.IntVar(value=4)
+        ttk.Spinbox(style_frame, from_=0, to=20, textvariable=self.border_var, width=5).grid(row=0, column=1, padx=2)
+
+        ttk.Label(style_frame, text="border color:").grid(row=0, column=2, sticky="e")
+        self.border_color_var = tk.StringVar(value="#000000")
+        self.border_color_entry = ttk.Entry(style_frame, textvariable=self.border_color_var, width=10)
+        self.border_color_entry.grid(row=0, column=3, padx=2)
+        ttk.Button(style_frame, text="Pick", command=self.pick_border_color).grid(row=0, column=4, padx=2)
+
+        # Gradient type
+        ttk.Label(style_frame, text="Gradient type:").grid(row=1, column=0, sticky="e")
+        self.gradient_type = tk.StringVar(value="none")
+        ttk.Combobox(style_frame, textvariable=self.gradient_type,
+                     values=["none", "linear", "radial"], width=8).grid(row=1, column=1, columnspan=2)
+
+        ttk.Label(style_frame, text="graduated color:").grid(row=1, column=3, sticky="e")
+        self.gradient_colors = ttk.Entry(style_frame, width=15)
+        self.gradient_colors.insert(0, "#FF0000,#0000FF")
+        self.gradient_colors.grid(row=1, column=4, padx=2)
+        ttk.Button(style_frame, text="Pick1", command=self.pick_gradient_color1).grid(row=1, column=5, padx=2)
+        ttk.Button(style_frame, text="Pick2", command=self.pick_gradient_color2).grid(row=1, column=6, padx=2)
+
+        # Info area
+        self.info_label = ttk.Label(root, text="Data length: 0 bytes | Current version: 2")
+        self.info_label.pack(pady=5)
+
+        # Button area (horizontal)
+        button_frame = ttk.Frame(root)
+        button_frame.pack(pady=10)
+        self.generate_button = ttk.Button(button_frame, text="Generate QR Code", command=self.generate_qr)
+        self.generate_button.pack(side=tk.LEFT, padx=10)
+        self.show_masks_btn = ttk.Button(button_frame, text="Display all masks and scores", command=self.show_all_masks)
+        self.show_masks_btn.pack(side=tk.LEFT, padx=10)
+        self.reset_button = ttk.Button(button_frame, text="Restore Color Option", command=self.reset_colors)
+        self.reset_button.pack(side=tk.LEFT, padx=10)
+        # Preview area
+        self.image_label = ttk.Label(root)
+        self.image_label.pack(pady=10)
+
+        # Warning info
+        self.warning_label = ttk.Label(
+            root,
+            text="Warning: Do not scan QR codes from unknown sources to avoid phishing and other security risks.",
+            foreground="red",
+            wraplength=400,
+            justify="center"
+        )
+        self.warning_label.pack(pady=5)
+
+    def pick_color(self):
+        """
+        Open color picker for QR color.
+        """
+        color = colorchooser.askcolor(title="Pick QR Color")
+        if color[1]:
+            self.color_var.set(color[1])
+
+    def pick_bg_color(self):
+        """
+        Open color picker for background color.
+        """
+        color = colorchooser.askcolor(title="Pick Background Color")
+        if color[1]:
+            self.bg_var.set(color[1])
+
+    def pick_border_color(self):
+        """
+        Open color picker for border color.
+        """
+        color = colorchooser.askcolor(title="Pick Border Color")
+        if color[1]:
+            self.border_color_var.set(color[1])
+
+    def pick_gradient_color1(self):
+        """
+        Open color picker for gradient start color.
+        """
+        color = colorchooser.askcolor(title="Pick Gradient Start Color")
+        if color[1]:
+            colors = self.gradient_colors.get().split(",")
+            if len(colors) == 2:
+                self.gradient_colors.delete(0, tk.END)
+                self.gradient_colors.insert(0, f"{color[1]},{colors[1].strip()}")
+            else:
+                self.gradient_colors.delete(0, tk.END)
+                self.gradient_colors.insert(0, f"{color[1]},#0000FF")
+
+    def pick_gradient_color2(self):
+        """
+        Open color picker for gradient end color.
+        """
+        color = colorchooser.askcolor(title="Pick Gradient End Color")
+        if color[1]:
+            colors = self.gradient_colors.get().split(",")
+            if len(colors) == 2:
+                self.gradient_colors.delete(0, tk.END)
+                self.gradient_colors.insert(0, f"{colors[0].strip()},{color[1]}")
+            else:
+                self.gradient_colors.delete(0, tk.END)
+                self.gradient_colors.insert(0, f"#FF0000,{color[1]}")
+
+    def generate_qr(self):
+        """
+        Generate QR code with current style settings and display in GUI.
+        """
+        input_string = self.entry.get()
+        color = self.color_var.get()
+        background = self.bg_var.get()
+        scale = self.scale_var.get()
+        border_width = self.border_var.get()
+        border_color = self.border_color_var.get()
+        gradient_type = self.gradient_type.get()
+        gradient_colors = [c.strip() for c in self.gradient_colors.get().split(",")]
+
+        if not input_string:
+            messagebox.showerror("Error", "Please enter a URL or text.")
+            return
+
+        try:
+            data_bytes = input_string.encode('utf-8')
+            data_length = len(data_bytes)
+
+            mask_images, mask_scores, best_mask, actual_version = qr_generator_version2.generate_qr_code2(
+                input_string,
+                color=color,
+                background=background,
+                scale=scale,
+                border_width=border_width,
+                border_color=border_color,
+                gradient_type=gradient_type,
+                gradient_colors=gradient_colors,
+                return_version=True
+            )
+
+            self.info_label.config(
+                text=f"data length: {data_length} bytes | current version: {actual_version}"
+            )
+
+            img = mask_images[best_mask]
+            img_tk = ImageTk.PhotoImage(img)
+            self.image_label.config(image=img_tk)
+            self.image_label.image = img_tk
+
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to generate QR code: {e}")
+
+    def show_all_masks(self):
+        """
+        Display all mask patterns and their penalty scores in a popup window.
+        """
+        input_string = self.entry.get()
+        color = self.color_var.get()
+        background = self.bg_var.get()
+        scale = self.scale_var.get()
+
+        if not input_string:
+            messagebox.showerror("Error", "Please enter a URL or text.")
+            return
+
+        try:
+            builder = qr_generator_version2.build_qr(input_string)
+            best_mask = builder.best_mask
+            # All masks drawn at thumbnail scale (about 120 px each) with their scores on one sheet
+            sheet = mask_sheet(input_string, color=color, background=background,
+                               scale=max(1, 120 // len(builder.code)))
+            # Popup display
+            win = tk.Toplevel(self.root)
+            win.title("All Masks and Scores (Best Mask Highlighted)")
+            img_tk = ImageTk.PhotoImage(sheet)
+            label = ttk.Label(win, image=img_tk)
+            label.image = img_tk
+            label.grid(row=0, column=0, padx=5, pady=5)
+            # Slideshow button
+            step_button = ttk.Button(win, text="Show QR Construction Steps",
+                                     command=lambda: self.show_steps(win, input_string, color, background, scale,
+                                                                     best_mask))
+            step_button.grid(row=1, column=0, pady=10)
+            win.grab_set()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to display masks: {e}")
+
+    def show_steps(self, mask_window, input_string, color, background, scale, best_mask):
+        """
+        Show a slideshow of QR code construction steps for the selected mask.
+        """
+        mask_window.destroy()
+        step_images = qr_generator_version2.generate_step_images(
+            input_string, color=color, background=background, scale=scale, mask_id=best_mask
+        )
+        step_titles = [
+            "Step 1: Finder Patterns",
+            "Step 2: Finder + Alignment Patterns",
+            "Step 3: Finder + Alignment + Data Bits",
+            "Step 4: Final QR Code (Masked)"
+        ]
+        slide_window = tk.Toplevel(self.root)
+        slide_window.title("QR Code Construction Slideshow")
+        slide_frame = ttk.Frame(slide_window)
+        slide_frame.pack(padx=10, pady=10)
+        img_label = ttk.Label(slide_frame)
+        img_label.pack()
+        title_label = ttk.Label(slide_frame, font=("Arial", 14))
+        title_label.pack(pady=5)
+        state = {'idx': 0}
+        img_tk_list = [ImageTk.PhotoImage(img.resize((300, 300), Image.NEAREST)) for img in step_images]
+
+        def update_slide():
+            idx = state['idx']
+            img_label.config(image=img_tk_list[idx])
+            img_label.image = img_tk_list[idx]
+            title_label.config(text=step_titles[idx])
+
+        def prev_slide():
+            if state['idx'] > 0:
+                state['idx'] -= 1
+                update_slide()
+
+        def next_slide():
+            if state['idx'] < len(step_images) - 1:
+                state['idx'] += 1
+                update_slide()
+
+        btn_frame = ttk.Frame(slide_window)
+        btn_frame.pack(pady=10)
+        prev_btn = ttk.Button(btn_frame, text="Previous", command=prev_slide)
+        prev_btn.grid(row=0, column=0, padx=5)
+        next_btn = ttk.Button(btn_frame, text="Next", command=next_slide)
+        next_btn.grid(row=0, column=1, padx=5)
+
+        update_slide()
+
+    # Restore colors to default values
+    def reset_colors(self):
+        self.color_var.set("#000000")
+        self.bg_var.set("#ffffff")
+        self.border_color_var.set("#000000")
+        self.gradient_type.set("none")
+        self.gradient_colors.delete(0, tk.END)
+        self.gradient_colors.insert(0, "#FF0000,#0000FF")
+
+# ===== Main Entry Point =====
+if __name__ == '__main__':
+    # Start the desktop GUI
+    root = tk.Tk()
+    app_gui = QRCodeGeneratorGUI(root)
+    root.mainloop()
\ No newline at end of file
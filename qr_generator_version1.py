@@ -12,11 +12,10 @@ It is the foundation of our QR code generator project.
 # ===== Imports and Global Constants =====
 from PIL import Image
 import io
-import os
 import tempfile
 import base64
-import reedsolo
 import itertools
+import logging
 
 # Mode dictionary for QR encoding
 mds = {'binary': 4}
@@ -56,15 +55,46 @@ tp_bits = {'L': {0: '111011111000100'}}
 # Mask patterns (only one for version 1)
 masks = [lambda r, c: (r + c) % 2 == 0]
 
+# ===== Build Tracing =====
+# QRBuilder calls trace(event, **fields) at each stage: 'bits' (bits), 'data_bytes' (data),
+# 'ecc' (codewords), 'codewords' (bits), 'template' (matrix), 'matrix' (mask, matrix).
+# Nothing is formatted unless the hook does it.
+logger = logging.getLogger(__name__)
+
+_TRACE_HEADINGS = {
+    'bits': "[Step 1] Encoded bit stream:",
+    'data_bytes': "[Step 2] 8-bit grouped data bytes:",
+    'ecc': "[Step 3] Reed-Solomon error correction codewords:",
+    'codewords': "[Step 4] Data codewords + error codewords bit stream:",
+    'template': "[Step 5] Matrix after adding finder/timing/separator/dark module:",
+    'matrix': "[Step 6] Final matrix after mask 0 applied:",
+}
+
+def print_trace(event, **fields):
+    # Trace hook printing the legacy debug output (used by debug=True)
+    print(_TRACE_HEADINGS[event])
+    if 'matrix' in fields:
+        for row in fields['matrix']:
+            print(''.join(['#' if x == 1 else '.' if x == 0 else ' ' for x in row]))
+        print()
+    else:
+        print(fields.get('bits', fields.get('data', fields.get('codewords'))))
+
+def log_trace(event, **fields):
+    # Trace hook logging events at DEBUG level; fields are attached as record.qr_trace
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s %r", event, fields, extra={'qr_trace': dict(fields, event=event)})
+
 # ===== QRBuilder: Core QR Code Construction Class =====
 class QRBuilder:
     """
     QRBuilder handles the process of encoding data into a QR code matrix.
     """
-    def __init__(self, data, version, mode, error, debug=False):
+    def __init__(self, data, version, mode, error, debug=False, trace=None):
         self.data = data
         self.version = 1  # Only version 1 supported
         self.debug = debug
+        self.trace = print_trace if debug else trace
     
         # Only binary mode is supported
         if mode != 'binary':
@@ -128,9 +158,8 @@ class QRBuilder:
         self.buf.write(self._lenbits())
         self.buf.write(self._encode())
 
-        if self.debug:
-            print("[Step 1] Encoded bit stream:")
-            print(self.buf.getvalue())
+        if self.trace is not None:
+            self.trace('bits', bits=self.buf.getvalue())
 
         bits = self._term(self.buf.getvalue())
         if bits:
@@ -147,9 +176,8 @@ class QRBuilder:
         # Convert bit stream to bytes
         data = [int(''.join(x), 2) for x in self._group(8, self.buf.getvalue())]
 
-        if self.debug:
-            print("[Step 2] 8-bit grouped data bytes:")
-            print(data)
+        if self.trace is not None:
+            self.trace('data_bytes', data=data)
 
         err_info = ecc[self.version][self.error]
         dbs = err_info[2]
@@ -158,9 +186,8 @@ class QRBuilder:
         db = data[:dbs]
         eb = self._rs(db, ebs)
 
-        if self.debug:
-            print("[Step 3] Reed-Solomon error correction codewords:")
-            print(eb)
+        if self.trace is not None:
+            self.trace('ecc', codewords=eb)
 
         data_buf = io.StringIO()
         for b in db:
@@ -170,9 +197,8 @@ class QRBuilder:
 
         self.buf = data_buf
 
-        if self.debug:
-            print("[Step 4] Data codewords + error codewords bit stream:")
-            print(self.buf.getvalue())
+        if self.trace is not None:
+            self.trace('codewords', bits=self.buf.getvalue())
 
     def _term(self, payload):
         # Add terminator bits if needed
@@ -205,6 +231,7 @@ class QRBuilder:
 
     def _rs(self, db, ebs):
         # Generate Reed-Solomon error correction codewords
+        import reedsolo  # imported on first use to keep module import fast
         db_bytes = bytes(db)
         rs = reedsolo.RSCodec(ebs)
         codeword = rs.encode(db_bytes)
@@ -226,9 +253,8 @@ class QRBuilder:
         # Add finder patterns, timing, etc.
         self._finder(tpl)
 
-        if self.debug:
-            print("[Step 5] Matrix after adding finder/timing/separator/dark module:")
-            self._print(tpl)
+        if self.trace is not None:
+            self.trace('template', matrix=tpl)
 
         # Apply mask
         self.msk = self._mask(tpl)
@@ -236,15 +262,8 @@ class QRBuilder:
         self.best_mask = 0
         self.code = self.msk[0]
 
-        if self.debug:
-            print("[Step 6] Final matrix after mask 0 applied:")
-            self._print(self.code)
-
-    def _print(self, m):
-        # Print QR matrix for debugging
-        for row in m:
-            print(''.join(['#' if x == 1 else '.' if x == 0 else ' ' for x in row]))
-        print()
+        if self.trace is not None:
+            self.trace('matrix', mask=0, matrix=self.code)
 
     def _finder(self, m):
         """
@@ -354,14 +373,15 @@ class QRCode:
     """
     QRCode is a high-level interface for generating QR codes.
     """
-    def __init__(self, content, error='L', version=None, mode=None, encoding='iso-8859-1', debug=False):
+    def __init__(self, content, error='L', version=None, mode=None, encoding='iso-8859-1', debug=False,
+                 trace=None):
         self.data = content
         self.error = error
         self.version = 1
         self.mode = mode
         self.encoding = encoding
         self.mode_num = mds.get(mode, mds['binary'])
-        self.code = QRBuilder(content, self.version, self.mode, self.error, debug=debug).code
+        self.code = QRBuilder(content, self.version, self.mode, self.error, debug=debug, trace=trace).code
 
     def __str__(self):
         return self.__repr__()
@@ -392,19 +412,31 @@ class QRCode:
         _png(self.code, self.version, file, scale,
              module_color=(0, 0, 0, 255), background=(255, 255, 255, 255), quiet_zone=quiet_zone)
 
-    def png_b64(self, scale=1, quiet_zone=4):
+    def png_bytes(self, scale=1, quiet_zone=4):
         """
-        Return PNG as base64 string.
+        Return PNG as bytes.
         """
         with io.BytesIO() as vf:
             self.png(file=vf, scale=scale, quiet_zone=quiet_zone)
-            img_str = base64.b64encode(vf.getvalue()).decode("ascii")
-        return img_str
+            return vf.getvalue()
+
+    def png_b64(self, scale=1, quiet_zone=4):
+        """
+        Return PNG as base64 string.
+        """
+        return base64.b64encode(self.png_bytes(scale=scale, quiet_zone=quiet_zone)).decode("ascii")
+
+    def image(self, scale=1, quiet_zone=4):
+        """
+        Return QR code as a 1-bit PIL Image built in memory.
+        """
+        sz = _png_size(self.version, scale, quiet_zone)
+        return Image.frombytes("1", (sz, sz), b''.join(_png_rows(self.code, scale, quiet_zone)))
 
 # ===== Factory and Utility Functions =====
-def make_qr(content, error='L', version=None, mode=None, encoding=None, debug=False):
+def make_qr(content, error='L', version=None, mode=None, encoding=None, debug=False, trace=None):
     # Factory function to create QRCode object
-    return QRCode(content, error, version, mode, encoding, debug=debug)
+    return QRCode(content, error, version, mode, encoding, debug=debug, trace=trace)
 
 def _png_size(version, scale, quiet=4):
     # Calculate PNG image size in pixels
@@ -415,27 +447,11 @@ def _png(code, version, file, scale=1, module_color=(0, 0, 0, 255),
          background=(255, 255, 255, 255), quiet_zone=4, debug=False):
     """
     Render QR code matrix to PNG file using pypng.
+    Rows are streamed to the encoder already packed, so memory stays O(width).
     """
     cnt = len(code)
     sz = cnt * scale + 2 * quiet_zone * scale
 
-    px = []
-    white = [1] * scale
-    black = [0] * scale
-
-    # Top margin
-    px.extend([[1] * sz for _ in range(quiet_zone * scale)])
-
-    for row in code:
-        row_px = [1] * (quiet_zone * scale)
-        for bit in row:
-            row_px.extend(black if bit else white)
-        row_px.extend([1] * (quiet_zone * scale))
-        px.extend([row_px] * scale)
-
-    # Bottom margin
-    px.extend([[1] * sz for _ in range(quiet_zone * scale)])
-
     try:
         import png
     except ImportError:
@@ -443,21 +459,48 @@ def _png(code, version, file, scale=1, module_color=(0, 0, 0, 255),
     w = png.Writer(sz, sz, greyscale=True, bitdepth=1)
     if isinstance(file, str):
         with open(file, 'wb') as f:
-            w.write(f, px)
+            w.write_packed(f, _png_rows(code, scale, quiet_zone))
     else:
-        w.write(file, px)
+        w.write_packed(file, _png_rows(code, scale, quiet_zone))
+
+def _png_rows(code, scale, quiet_zone):
+    """
+    Yield the packed 1-bit rows of the image (1 is white, 0 is black).
+    Each module row is packed once and repeated scale times.
+    """
+    sz = len(code) * scale + 2 * quiet_zone * scale
+    pad = -sz % 8
+    margin = '1' * (quiet_zone * scale)
+    white = '1' * scale
+    black = '0' * scale
+
+    def pack(bits):
+        # Pack a string of pixel bits into bytes, padding the row to a byte boundary
+        return int(bits + '0' * pad, 2).to_bytes((sz + pad) // 8, 'big')
+
+    # Top margin
+    blank = pack('1' * sz)
+    for _ in range(quiet_zone * scale):
+        yield blank
+
+    for row in code:
+        packed = pack(margin + ''.join(black if bit else white for bit in row) + margin)
+        for _ in range(scale):
+            yield packed
+
+    # Bottom margin
+    for _ in range(quiet_zone * scale):
+        yield blank
 
-def qr_img(data, debug=False):
+def qr_img(data, debug=False, as_png=False, trace=None):
     """
     Generate QR code image from input string.
-    Returns a PIL Image object.
+    Returns a PIL Image object, or the PNG bytes if as_png is True.
+    debug=True prints every build stage; trace takes a custom trace hook instead.
     """
     version = 1
     error = 'L'
-    qr = make_qr(data, error=error, version=version, mode='binary', debug=debug)
-    tmp = tempfile.NamedTemporaryFile('wb', suffix='.png', delete=False)
-    qr.png(tmp, scale=10)
-    tmp.close()
-    img = Image.open(tmp.name).convert("1")
-    os.unlink(tmp.name)
-    return img
\ No newline at end of file
+    qr = make_qr(data, error=error, version=version, mode='binary', debug=debug, trace=trace)
+    if as_png:
+        return qr.png_bytes(scale=10)
+    return qr.image(scale=10)
\ No newline at end of file
@@ -11,13 +11,21 @@ Also, it provides the core functionality for generating QR codes with more vario
 # 31808380_MaoLeping help to design the _png function and modified the QR rendering.
 
 # ===== Imports and Global Constants =====
-from PIL import Image
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+from collections import OrderedDict
 import io
 import os
 import tempfile
 import base64
-import reedsolo
+import bisect
+import functools
 import itertools
+import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
+import zlib
 
 # Mode indicators for different data types
 mds = {'binary': 4}
@@ -77,6 +85,12 @@ masks = [
     lambda row, col: (((row * col) % 2) + ((row * col) % 3)) % 2 == 0,
     lambda row, col: (((row + col) % 2) + ((row * col) % 3)) % 2 == 0]
 
+# Per-version tables, filled on first use or by warm_up(): function pattern templates,
+# data module placement orders, and Reed-Solomon codecs keyed on the number of ECC bytes
+_templates = {}
+_placements = {}
+_rs_codecs = {}
+
 
 # ===== Color and Gradient Utilities =====
 def hex_to_rgb(hex_color):
@@ -94,6 +108,21 @@ def hex_to_rgb(hex_color):
     return tuple(int(hex_color[i:i + lv // 3], 16) for i in range(0, lv, lv // 3))
 
 
+def color_to_rgb(color):
+    """
+    Convert any PIL color specification (hex code, color name or tuple) to an RGB tuple.
+
+    Args:
+        color (str or tuple): Color specification (e.g., '#FF0000', 'red', (255, 0, 0))
+
+    Returns:
+        tuple: RGB color values (r, g, b)
+    """
+    if isinstance(color, str):
+        return ImageColor.getrgb(color)[:3]
+    return tuple(color[:3])
+
+
 def create_linear_gradient(size, color1, color2, horizontal=True):
     """
     Generate a linear gradient image.
@@ -191,6 +220,165 @@ def calculate_penalty(mask):
     return score
 
 
+# ===== Build Tracing =====
+# A trace hook is called as trace(event, **fields) at each stage of QRBuilder:
+#   'bits' (bits), 'data_bytes' (data), 'ecc' (codewords), 'codewords' (bits),
+#   'template' (matrix), 'mask_penalty' (mask, scores, total), 'best_mask' (mask),
+#   'matrix' (mask, matrix)
+# Fields are the builder's own objects; nothing is formatted unless the hook does it,
+# and without a hook no event is created at all.
+logger = logging.getLogger(__name__)
+
+_TRACE_HEADINGS = {
+    'bits': "[Step 1] Encoded bit stream:",
+    'data_bytes': "[Step 2] 8-bit grouped data bytes:",
+    'ecc': "[Step 3] Reed-Solomon error correction codewords:",
+    'codewords': "[Step 4] Data codewords + error codewords bit stream:",
+    'template': "[Step 5] Matrix after adding finder/timing/separator/dark module:",
+    'matrix': "[Step 7] Final matrix after best mask applied:",
+}
+
+
+def print_trace(event, **fields):
+    """
+    Trace hook that prints build events in the legacy debug format (used by debug=True).
+
+    Args:
+        event (str): Event name
+        **fields: Event fields
+    """
+    if event == 'mask_penalty':
+        print(f"Mask {fields['mask']} penalty scores: {fields['scores']}, total: {fields['total']}")
+        return
+    if event == 'best_mask':
+        print(f"[Step 6] Best mask selected: {fields['mask']}")
+        return
+    print(_TRACE_HEADINGS[event])
+    if 'matrix' in fields:
+        for row in fields['matrix']:
+            print(''.join(['#' if x == 1 else '.' if x == 0 else ' ' for x in row]))
+        print()
+    else:
+        print(fields.get('bits', fields.get('data', fields.get('codewords'))))
+
+
+def log_trace(event, **fields):
+    """
+    Trace hook that sends build events to this module's logger at DEBUG level.
+    The message is only formatted if a handler emits it; the event and fields are
+    also attached to the record as record.qr_trace for structured handlers.
+
+    Args:
+        event (str): Event name
+        **fields: Event fields
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s %r", event, fields, extra={'qr_trace': dict(fields, event=event)})
+
+
+# ===== Stage Timing =====
+# Upper bounds of the timing histogram buckets, in seconds (a final +Inf bucket follows)
+TIMING_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+_timing_enabled = False
+# Stage name -> [count, total seconds, per-bucket counts]
+_timings = {}
+_timings_lock = threading.Lock()
+
+
+def enable_timing(enabled=True):
+    """
+    Turn per-stage timing on or off. While off, timed stages only pay one flag check.
+
+    Args:
+        enabled (bool): Whether to record stage timings
+    """
+    global _timing_enabled
+    _timing_enabled = enabled
+
+
+def reset_timing():
+    """
+    Discard all recorded stage timings.
+    """
+    with _timings_lock:
+        _timings.clear()
+
+
+def timing_snapshot():
+    """
+    Get the recorded stage timings as histograms.
+
+    Returns:
+        dict: Stage name -> {'count': int, 'sum': float (seconds),
+            'buckets': {upper bound: cumulative count}}, the last bound being inf
+    """
+    bounds = TIMING_BUCKETS + (float('inf'),)
+    with _timings_lock:
+        items = [(stage, count, total, list(counts)) for stage, (count, total, counts) in _timings.items()]
+    return {stage: {'count': count, 'sum': total,
+                    'buckets': dict(zip(bounds, itertools.accumulate(counts)))}
+            for stage, count, total, counts in items}
+
+
+def _record_timing(stage, elapsed):
+    """
+    Add one duration to the histogram of a stage.
+    """
+    i = bisect.bisect_left(TIMING_BUCKETS, elapsed)
+    with _timings_lock:
+        hist = _timings.get(stage)
+        if hist is None:
+            hist = _timings[stage] = [0, 0.0, [0] * (len(TIMING_BUCKETS) + 1)]
+        hist[0] += 1
+        hist[1] += elapsed
+        hist[2][i] += 1
+
+
+def timed(stage):
+    """
+    Decorator recording the duration of every call under the given stage name
+    while timing is enabled (see enable_timing).
+
+    Args:
+        stage (str): Stage name
+
+    Returns:
+        function: Decorator
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _timing_enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record_timing(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+# ===== Deadlines =====
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when a generation call is still running at its deadline.
+    """
+
+
+def check_deadline(deadline):
+    """
+    Raise DeadlineExceeded if the deadline has passed.
+    Generation functions call this between stages, so work stops soon after the deadline.
+
+    Args:
+        deadline (float): time.monotonic() value to stop at, or None for no deadline
+    """
+    if deadline is not None and time.monotonic() > deadline:
+        raise DeadlineExceeded("QR code generation took too long")
+
+
 # ===== Core QR Code Construction Class =====
 class QRBuilder:
     """
@@ -198,7 +386,7 @@ class QRBuilder:
     Implements the core QR code generation algorithm.
     """
 
-    def __init__(self, data, version, mode, error, debug=False):
+    def __init__(self, data, version, mode, error, debug=False, trace=None, deadline=None):
         """
         Initialize QR code builder.
 
@@ -207,11 +395,15 @@ class QRBuilder:
             version (int): QR code version (1 or 2)
             mode (str): Encoding mode
             error (str): Error correction level
-            debug (bool): Enable debug output
+            debug (bool): Print every stage (same as trace=print_trace)
+            trace (callable): Trace hook called with each build event (see Build Tracing)
+            deadline (float): time.monotonic() value to stop at (see check_deadline)
         """
         self.data = data
         self.version = version
         self.debug = debug
+        self.trace = print_trace if debug else trace
+        self.deadline = deadline
 
         if mode != 'binary':
             raise ValueError(f'{mode} is not a valid mode.')
@@ -225,6 +417,7 @@ class QRBuilder:
         self.buf = io.StringIO()
 
         self._add()
+        check_deadline(deadline)
         self._make()
 
     def _group(self, n, it, fill=None):
@@ -296,6 +489,7 @@ class QRBuilder:
                 buf.write(format(val, '08b'))
             return buf.getvalue()
 
+    @timed('encode')
     def _add(self):
         """
         Add mode indicator, length field, and encoded data to buffer.
@@ -305,9 +499,8 @@ class QRBuilder:
         self.buf.write(self._lenbits())
         self.buf.write(self._encode())
 
-        if self.debug:
-            print("[Step 1] Encoded bit stream:")
-            print(self.buf.getvalue())
+        if self.trace is not None:
+            self.trace('bits', bits=self.buf.getvalue())
 
         bits = self._term(self.buf.getvalue())
         if bits:
@@ -323,9 +516,8 @@ class QRBuilder:
 
         data = [int(''.join(x), 2) for x in self._group(8, self.buf.getvalue())]
 
-        if self.debug:
-            print("[Step 2] 8-bit grouped data bytes:")
-            print(data)
+        if self.trace is not None:
+            self.trace('data_bytes', data=data)
 
         err_info = ecc[self.version][self.error]
         dbs = err_info[2]
@@ -334,9 +526,8 @@ class QRBuilder:
         db = data[:dbs]
         eb = self._rs(db, ebs)
 
-        if self.debug:
-            print("[Step 3] Reed-Solomon error correction codewords:")
-            print(eb)
+        if self.trace is not None:
+            self.trace('ecc', codewords=eb)
 
         data_buf = io.StringIO()
         for b in db:
@@ -346,9 +537,8 @@ class QRBuilder:
 
         self.buf = data_buf
 
-        if self.debug:
-            print("[Step 4] Data codewords + error codewords bit stream:")
-            print(self.buf.getvalue())
+        if self.trace is not None:
+            self.trace('codewords', bits=self.buf.getvalue())
 
     def _term(self, payload):
         """
@@ -397,6 +587,7 @@ class QRBuilder:
         block = itertools.cycle(['11101100', '00010001'])
         return ''.join(next(block) for _ in range(need))
 
+    @timed('rs')
     def _rs(self, db, ebs):
         """
         Generate Reed-Solomon error correction codewords.
@@ -409,7 +600,10 @@ class QRBuilder:
             list: Error correction codewords
         """
         db_bytes = bytes(db)
-        rs = reedsolo.RSCodec(ebs)
+        rs = _rs_codecs.get(ebs)
+        if rs is None:
+            import reedsolo  # imported on first use to keep module import fast
+            rs = _rs_codecs[ebs] = reedsolo.RSCodec(ebs)
         codeword = rs.encode(db_bytes)
         ecc_bytes = codeword[-ebs:]
         return list(ecc_bytes)
@@ -419,24 +613,15 @@ class QRBuilder:
         Construct the final QR code matrix with finder patterns,
         alignment patterns, and data bits.
         """
-        from copy import deepcopy
-
-        sz = v_sz[self.version]
-
-        row = [' ' for x in range(sz)]
-        tpl = [deepcopy(row) for x in range(sz)]
+        tpl = self._template()
 
-        self._finder(tpl)
-        if self.version >= 2:
-            self._alignment(tpl)
-
-        if self.debug:
-            print("[Step 5] Matrix after adding finder/timing/separator/dark module:")
-            self._print(tpl)
+        if self.trace is not None:
+            self.trace('template', matrix=tpl)
 
         # Generate all 8 masks
         self.masks = []
         for i in range(8):
+            check_deadline(self.deadline)
             cur_mask = [row[:] for row in tpl]
             self._type(cur_mask, tp_bits[self.error][i])
             self._apply_mask(cur_mask, masks[i])
@@ -446,22 +631,60 @@ class QRBuilder:
         self.best_mask = self._select_best_mask()
         self.code = self.masks[self.best_mask]
 
-        if self.debug:
-            print(f"[Step 6] Best mask selected: {self.best_mask}")
-            print("[Step 7] Final matrix after best mask applied:")
-            self._print(self.code)
+        if self.trace is not None:
+            self.trace('best_mask', mask=self.best_mask)
+            self.trace('matrix', mask=self.best_mask, matrix=self.code)
 
-    def _print(self, m):
+    def _template(self):
         """
-        Print QR code matrix for debugging.
+        Get the template of this version: finder, separator, timing and
+        alignment patterns and the dark module. Built once per version.
 
-        Args:
-            m (list): 2D matrix to print
+        Returns:
+            list: Shared template matrix (copy it before modifying)
         """
-        for row in m:
-            print(''.join(['#' if x == 1 else '.' if x == 0 else ' ' for x in row]))
-        print()
+        tpl = _templates.get(self.version)
+        if tpl is None:
+            sz = v_sz[self.version]
+            tpl = [[' ' for _ in range(sz)] for _ in range(sz)]
+            self._finder(tpl)
+            if self.version >= 2:
+                self._alignment(tpl)
+            _templates[self.version] = tpl
+        return tpl
+
+    def _placement(self):
+        """
+        Get the zigzag order in which data bits fill the free modules of this version.
+        Format information occupies the same modules for every mask, so the order
+        is computed once per version.
 
+        Returns:
+            list: (row, col) positions in placement order
+        """
+        order = _placements.get(self.version)
+        if order is None:
+            m = [row[:] for row in self._template()]
+            self._type(m, tp_bits[self.error][0])
+            order = []
+
+            row_start = itertools.cycle([len(m) - 1, 0])
+            row_stop = itertools.cycle([-1, len(m)])
+            direction = itertools.cycle([-1, 1])
+
+            for col in range(len(m) - 1, 0, -2):
+                if col <= 6:
+                    col -= 1
+                col_pair = itertools.cycle([col, col - 1])
+                for row in range(next(row_start), next(row_stop), next(direction)):
+                    for _ in range(2):
+                        c = next(col_pair)
+                        if m[row][c] == ' ':
+                            order.append((row, c))
+            _placements[self.version] = order
+        return order
+
+    @timed('template')
     def _finder(self, m):
         """
         Add finder patterns to the matrix.
@@ -519,6 +742,7 @@ class QRBuilder:
         # Dark module
         m[-8][8] = 1
 
+    @timed('template')
     def _alignment(self, m):
         """
         Add alignment pattern for version 2+ QR codes.
@@ -568,6 +792,7 @@ class QRBuilder:
             j = -i
             m[j if j > 6 else j - 1][8] = bit
 
+    @timed('mask')
     def _apply_mask(self, m, pattern):
         """
         Apply mask pattern to the matrix.
@@ -576,40 +801,30 @@ class QRBuilder:
             m (list): QR code matrix
             pattern (function): Mask pattern function
         """
-        bits = iter(self.buf.getvalue())
-
-        row_start = itertools.cycle([len(m) - 1, 0])
-        row_stop = itertools.cycle([-1, len(m)])
-        direction = itertools.cycle([-1, 1])
-
-        for col in range(len(m) - 1, 0, -2):
-            if col <= 6:
-                col -= 1
-            col_pair = itertools.cycle([col, col - 1])
-            for row in range(next(row_start), next(row_stop), next(direction)):
-                for _ in range(2):
-                    c = next(col_pair)
-                    if m[row][c] != ' ':
-                        continue
-                    try:
-                        bit = int(next(bits))
-                    except StopIteration:
-                        bit = 0
-                    m[row][c] = bit ^ 1 if pattern(row, c) else bit
+        bits = self.buf.getvalue()
+        n = len(bits)
+        for i, (row, c) in enumerate(self._placement()):
+            bit = int(bits[i]) if i < n else 0
+            m[row][c] = bit ^ 1 if pattern(row, c) else bit
 
+    @timed('score')
     def _select_best_mask(self):
         """
         Select the best mask pattern based on penalty scores.
+        The per-rule scores of every mask are kept in self.scores.
 
         Returns:
             int: Index of the best mask pattern
         """
+        self.scores = []
         scores = []
         for i in range(len(self.masks)):
+            check_deadline(self.deadline)
             penalty = calculate_penalty(self.masks[i])
+            self.scores.append(penalty)
             scores.append(sum(penalty))
-            if self.debug:
-                print(f"Mask {i} penalty scores: {penalty}, total: {sum(penalty)}")
+            if self.trace is not None:
+                self.trace('mask_penalty', mask=i, scores=penalty, total=sum(penalty))
 
         best = scores.index(min(scores))
         return best
@@ -621,7 +836,8 @@ class QRCode:
     Main QR Code class that handles QR code generation and customization.
     """
 
-    def __init__(self, content, error='L', version=None, mode=None, encoding='iso-8859-1', debug=False):
+    def __init__(self, content, error='L', version=None, mode=None, encoding='iso-8859-1', debug=False,
+                 trace=None):
         """
         Initialize QR code generator.
 
@@ -631,7 +847,8 @@ class QRCode:
             version (int): QR code version
             mode (str): Encoding mode
             encoding (str): Character encoding
-            debug (bool): Enable debug output
+            debug (bool): Print every build stage
+            trace (callable): Build trace hook (see Build Tracing)
         """
         self.data = content
         self.error = error
@@ -649,13 +866,13 @@ class QRCode:
         self.mode_num = mds.get(mode, mds['binary'])
 
         try:
-            self.code = QRBuilder(content, self.version, self.mode, self.error, debug=debug).code
+            self.code = QRBuilder(content, self.version, self.mode, self.error, debug=debug, trace=trace).code
         except ValueError as e:
             if "would not fit" in str(e):
                 # Try version 2 if version 1 fails
                 if self.version == 1:
                     self.version = 2
-                    self.code = QRBuilder(content, self.version, self.mode, self.error, debug=debug).code
+                    self.code = QRBuilder(content, self.version, self.mode, self.error, debug=debug, trace=trace).code
                 else:
                     raise
             else:
@@ -762,9 +979,24 @@ class QRCode:
             img_str = base64.b64encode(vf.getvalue()).decode("ascii")
         return img_str
 
+    def svg(self, scale=1, module_color=(0, 0, 0, 255), background=(255, 255, 255, 255), quiet_zone=4):
+        """
+        Generate SVG image of QR code.
+
+        Args:
+            scale (int): Size scale
+            module_color (tuple): QR code color (RGBA)
+            background (tuple): Background color (RGBA)
+            quiet_zone (int): Quiet zone size
+
+        Returns:
+            str: SVG document
+        """
+        return _svg(self.code, scale, module_color, background, quiet_zone * scale, background)
+
 
 # ===== Factory and Utility Functions =====
-def make_qr(content, error='L', version=None, mode=None, encoding=None, debug=False):
+def make_qr(content, error='L', version=None, mode=None, encoding=None, debug=False, trace=None):
     """
     Create a QR code.
 
@@ -774,12 +1006,13 @@ def make_qr(content, error='L', version=None, mode=None, encoding=None, debug=Fa
         version (int): QR code version
         mode (str): Encoding mode
         encoding (str): Character encoding
-        debug (bool): Enable debug output
+        debug (bool): Print every build stage
+        trace (callable): Build trace hook (see Build Tracing)
 
     Returns:
         QRCode: QR code object
     """
-    return QRCode(content, error, version, mode, encoding, debug=debug)
+    return QRCode(content, error, version, mode, encoding, debug=debug, trace=trace)
 
 
 def _png_size(version, scale, quiet=4):
@@ -798,6 +1031,51 @@ def _png_size(version, scale, quiet=4):
     return scale * v_sz[version] + 2 * quiet * scale
 
 
+# Bytes per pixel held while rendering one styled image (see _render_styled): the indexed
+# render and its recolored copy for solid colors; gradients add the RGB result, the module
+# crop, the dark mask and the scaled RGB gradient
+_SOLID_BYTES_PER_PIXEL = 2
+_GRADIENT_BYTES_PER_PIXEL = 10
+
+
+def render_budget(version, scale, border_width=4, gradient=False, images=1):
+    """
+    Project the pixels and memory of rendering styled images, without rendering them.
+
+    Args:
+        version (int): QR code version
+        scale (int): Size scale
+        border_width (int): Border width
+        gradient (bool): Whether a gradient is applied
+        images (int): Number of images held at the same time
+
+    Returns:
+        tuple: (pixels, bytes)
+    """
+    side = int(scale) * v_sz[version] + 2 * int(border_width)
+    pixels = side * side * images
+    return pixels, pixels * (_GRADIENT_BYTES_PER_PIXEL if gradient else _SOLID_BYTES_PER_PIXEL)
+
+
+def max_render_scale(version, border_width, max_bytes, gradient=False, images=1):
+    """
+    Largest scale whose render_budget stays within max_bytes.
+
+    Args:
+        version (int): QR code version
+        border_width (int): Border width
+        max_bytes (int): Memory limit in bytes
+        gradient (bool): Whether a gradient is applied
+        images (int): Number of images held at the same time
+
+    Returns:
+        int: Largest scale, or 0 if even scale 1 does not fit
+    """
+    bpp = _GRADIENT_BYTES_PER_PIXEL if gradient else _SOLID_BYTES_PER_PIXEL
+    side = math.isqrt(max_bytes // (bpp * images))
+    return max(0, (side - 2 * int(border_width)) // v_sz[version])
+
+
 def _png(code, version, file, scale=1, module_color=(0, 0, 0, 255),
          background=(255, 255, 255, 255), quiet_zone=4, debug=False):
     """
@@ -816,21 +1094,6 @@ def _png(code, version, file, scale=1, module_color=(0, 0, 0, 255),
     cnt = len(code)
     sz = cnt * scale + 2 * quiet_zone * scale
 
-    px = []
-    white = [1] * scale
-    black = [0] * scale
-
-    px.extend([[1] * sz for _ in range(quiet_zone * scale)])
-
-    for row in code:
-        row_px = [1] * (quiet_zone * scale)
-        for bit in row:
-            row_px.extend(black if bit else white)
-        row_px.extend([1] * (quiet_zone * scale))
-        px.extend([row_px] * scale)
-
-    px.extend([[1] * sz for _ in range(quiet_zone * scale)])
-
     try:
         import png
     except ImportError:
@@ -838,242 +1101,1080 @@ def _png(code, version, file, scale=1, module_color=(0, 0, 0, 255),
     w = png.Writer(sz, sz, greyscale=True, bitdepth=1)
     if isinstance(file, str):
         with open(file, 'wb') as f:
-            w.write(f, px)
+            w.write_packed(f, _png_rows(code, scale, quiet_zone))
     else:
-        w.write(file, px)
+        w.write_packed(file, _png_rows(code, scale, quiet_zone))
 
 
-# ===== QR Code Image Generation and Advanced Styling =====
-def qr_img(data, color="#000000", background="#ffffff", scale=10, border_width=4, border_color="#000000",
-           shape="square", **kwargs):
+def _png_rows(code, scale, quiet_zone):
     """
-    Generate QR code image with custom styling.
+    Generate the packed 1-bit rows of a PNG image (1 is white, 0 is black).
+    Each module row is packed once and repeated scale times, so memory stays O(width).
 
     Args:
-        data (str): Content to encode
-        color (str): QR code color (hex)
-        background (str): Background color (hex)
+        code (list): QR code matrix
         scale (int): Size scale
-        border_width (int): Border width
-        border_color (str): Border color (hex)
-        shape (str): Module shape ('square' or 'circle')
-        **kwargs: Additional styling parameters
+        quiet_zone (int): Quiet zone size
 
-    Returns:
-        PIL.Image: QR code image
+    Yields:
+        bytes: Packed pixel row
     """
-    version = None  # Auto-detect version
-    error = 'L'
-    qr = make_qr(data, error=error, version=version, mode='binary', debug=False)
-    code = qr.code
-    size = len(code)
-    img_size = size * scale + 2 * border_width
+    sz = len(code) * scale + 2 * quiet_zone * scale
+    pad = -sz % 8
+    margin = '1' * (quiet_zone * scale)
+    white = '1' * scale
+    black = '0' * scale
 
-    img = Image.new("RGB", (img_size, img_size), background)
-    draw = ImageDraw = __import__('PIL.ImageDraw', fromlist=['ImageDraw']).ImageDraw
-    draw = draw(img)
+    def pack(bits):
+        return int(bits + '0' * pad, 2).to_bytes((sz + pad) // 8, 'big')
 
-    # Draw border
-    if border_width > 0:
-        for x in range(img_size):
-            for y in range(border_width):
-                img.putpixel((x, y), hex_to_rgb(border_color))
-                img.putpixel((x, img_size - 1 - y), hex_to_rgb(border_color))
-        for y in range(img_size):
-            for x in range(border_width):
-                img.putpixel((x, y), hex_to_rgb(border_color))
-                img.putpixel((img_size - 1 - x, y), hex_to_rgb(border_color))
-
-    # Draw QR code content
-    for y in range(size):
-        for x in range(size):
-            if code[y][x] == 1:
-                px = x * scale + border_width
-                py = y * scale + border_width
-                if shape == "circle":
-                    draw.ellipse([px, py, px + scale - 1, py + scale - 1], fill=color)
-                else:
-                    draw.rectangle([px, py, px + scale - 1, py + scale - 1], fill=color)
+    blank = pack('1' * sz)
+    for _ in range(quiet_zone * scale):
+        yield blank
+
+    for row in code:
+        packed = pack(margin + ''.join(black if bit else white for bit in row) + margin)
+        for _ in range(scale):
+            yield packed
+
+    for _ in range(quiet_zone * scale):
+        yield blank
+
+
+# ===== PNG Encoding =====
+# Encoder settings for each speed/size preset (zlib level and strategy, adaptive filter search)
+PNG_PRESETS = {
+    'speed': {'compress_level': 1, 'compress_type': zlib.Z_RLE},
+    'balanced': {'compress_level': 6},
+    'size': {'compress_level': 9, 'optimize': True},
+}
+
+
+def _reduce_colors(img):
+    """
+    Convert an image to the smallest PNG color type that keeps it exact.
+    Palette images lose unused and duplicate palette entries (so a two-color
+    code becomes 1-bit), and RGB images with few colors become palette images.
+    Images with many colors (gradients) are returned unchanged.
+
+    Args:
+        img (PIL.Image): Image to reduce
+
+    Returns:
+        PIL.Image: Image in mode '1', 'P' or its original mode
+    """
+    if img.mode == "P":
+        palette = img.getpalette()
+        lut = list(range(256))
+        colors = []
+        for _, index in img.getcolors(256):
+            rgb = tuple(palette[index * 3:index * 3 + 3])
+            if rgb not in colors:
+                colors.append(rgb)
+            lut[index] = colors.index(rgb)
+        if lut == list(range(256)) and len(colors) * 3 == len(palette):
+            return img
+        reduced = img.point(lut)
+        reduced.putpalette([c for rgb in colors for c in rgb])
+        return reduced
+
+    if img.mode == "RGB":
+        used = img.getcolors(16)
+        if used is None:
+            return img
+        pal_img = Image.new("P", (1, 1))
+        pal_img.putpalette([c for _, rgb in used for c in rgb])
+        return img.quantize(len(used), palette=pal_img, dither=Image.Dither.NONE)
 
     return img
 
 
-def generate_qr_code2(input_string, color="#000000", background="#ffffff", scale=10,
-                     border_width=4, border_color="#000000", gradient_type="none",
-                     gradient_colors=None, return_version=False):
+@timed('png_encode')
+def encode_png(img, preset='balanced', compress_level=None, compress_type=None):
     """
-    Generate QR code with advanced styling options.
+    Encode an image as PNG bytes with the bit depth chosen from the colors actually used:
+    1-bit for two colors, 2-bit palette for up to four, RGB only for gradients.
 
     Args:
-        input_string (str): Content to encode
-        color (str): QR code color (hex)
-        background (str): Background color (hex)
-        scale (int): Size scale
-        border_width (int): Border width
-        border_color (str): Border color (hex)
-        gradient_type (str): Gradient type ('none', 'linear', or 'radial')
-        gradient_colors (list): List of two colors for gradient
-        return_version (bool): Whether to return QR code version
+        img (PIL.Image): Image to encode
+        preset (str): Speed/size trade-off ('speed', 'balanced' or 'size')
+        compress_level (int): zlib compression level 0-9, overrides the preset
+        compress_type (int): zlib strategy (e.g. zlib.Z_RLE), overrides the preset
 
     Returns:
-        tuple: (mask_images, mask_scores, best_mask[, version])
+        bytes: PNG image data
     """
-    # Generate QR code object
-    qr = make_qr(input_string, error='L', version=None, mode='binary', debug=False)
-    builder = QRBuilder(input_string, qr.version, 'binary', 'L')
-    masks = builder.masks
-    # Detailed scoring
-    mask_scores = [calculate_penalty(mask) for mask in masks]
-    best_mask = builder.best_mask
-    version = qr.version
+    if preset not in PNG_PRESETS:
+        raise ValueError(f'{preset} is not a valid PNG preset.')
+    options = dict(PNG_PRESETS[preset])
+    if compress_level is not None:
+        options['compress_level'] = compress_level
+    if compress_type is not None:
+        options['compress_type'] = compress_type
 
-    # Generate QR code images for all 8 masks
-    size = len(masks[0])
-    img_size = size * scale + 2 * border_width
-    mask_images = []
-    for idx, mask in enumerate(masks):
-        img = Image.new("RGB", (img_size, img_size), background)
-        draw = __import__('PIL.ImageDraw', fromlist=['ImageDraw']).ImageDraw(img)
-        # Border
-        if border_width > 0:
-            for x in range(img_size):
-                for y in range(border_width):
-                    img.putpixel((x, y), hex_to_rgb(border_color))
-                    img.putpixel((x, img_size - 1 - y), hex_to_rgb(border_color))
-            for y in range(img_size):
-                for x in range(border_width):
-                    img.putpixel((x, y), hex_to_rgb(border_color))
-                    img.putpixel((img_size - 1 - x, y), hex_to_rgb(border_color))
-
-        # Gradient support
-        grad_img = None
-        if gradient_type != "none" and gradient_colors and len(gradient_colors) == 2:
-            grad_img = create_linear_gradient(
-                (size, size),
-                hex_to_rgb(gradient_colors[0]),
-                hex_to_rgb(gradient_colors[1]),
-                horizontal=(gradient_type == "linear")
-            )
-
-        for y in range(size):
-            for x in range(size):
-                if mask[y][x] == 1:
-                    px = x * scale + border_width
-                    py = y * scale + border_width
-                    # Sample gradient color or normal color
-                    if grad_img:
-                        fill_color = grad_img.getpixel((x, y))
-                    else:
-                        fill_color = color
-                    if isinstance(fill_color, str):
-                        fill_color = hex_to_rgb(fill_color)
-                    draw.rectangle([px, py, px + scale - 1, py + scale - 1], fill=fill_color)
-        mask_images.append(img)
+    with io.BytesIO() as buf:
+        _reduce_colors(img).save(buf, format="PNG", **options)
+        return buf.getvalue()
 
-    if return_version:
-        return mask_images, mask_scores, best_mask, version
-    else:
-        return mask_images, mask_scores, best_mask
 
+# Threads of the pool shared by all encode_png_many calls (see set_png_workers)
+_png_workers = min(8, os.cpu_count() or 1)
+_png_pool = None
+_png_pool_lock = threading.Lock()
 
-# ===== Step-by-Step QR Code Construction Visualization =====
-def generate_step_images(input_string, color="#000000", background="#ffffff", scale=10, mask_id=0):
+
+def set_png_workers(workers):
     """
-    Generate step-by-step QR code construction images.
+    Set the number of threads encode_png_many encodes with.
+    zlib releases the GIL while it compresses, so the encodes of one call overlap
+    on multi-core hosts. With 1 (or 0) thread images are encoded one after another.
 
     Args:
-        input_string (str): Content to encode
-        color (str): QR code color (hex)
-        background (str): Background color (hex)
-        scale (int): Size scale
-        mask_id (int): Mask pattern index
+        workers (int): Thread count of the shared encoding pool
+    """
+    global _png_workers, _png_pool
+    with _png_pool_lock:
+        _png_workers = workers
+        pool, _png_pool = _png_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False)
+
+
+def _png_executor():
+    """
+    Return the shared encoding pool, created on first use, or None if encoding is serial.
+    """
+    global _png_pool
+    with _png_pool_lock:
+        if _png_pool is None and _png_workers > 1:
+            _png_pool = ThreadPoolExecutor(_png_workers, thread_name_prefix='qr-png')
+        return _png_pool
+
+
+def _forget_png_pool():
+    """
+    Drop the encoding pool in a forked child (pre-fork servers warm up in the master).
+    The child inherits the pool object but none of its threads, so it would wait forever.
+    """
+    global _png_pool, _png_pool_lock
+    _png_pool = None
+    _png_pool_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_png_pool)
+
+
+def encode_png_many(images, preset='balanced', compress_level=None, compress_type=None):
+    """
+    Encode several images as PNG bytes in the shared thread pool (see set_png_workers).
+
+    Args:
+        images (iterable): Images to encode
+        preset (str): Speed/size trade-off ('speed', 'balanced' or 'size')
+        compress_level (int): zlib compression level 0-9, overrides the preset
+        compress_type (int): zlib strategy (e.g. zlib.Z_RLE), overrides the preset
 
     Returns:
-        list: List of PIL.Image objects showing construction steps
+        list: PNG image data of each image, in the order of images
     """
-    qr = make_qr(input_string, error='L', version=None, mode='binary', debug=False)
-    builder = QRBuilder(input_string, qr.version, 'binary', 'L')
-    size = len(builder.masks[0])
-    border_width = 4
-    img_size = size * scale + 2 * border_width
+    images = list(images)
+    encode = functools.partial(encode_png, preset=preset, compress_level=compress_level,
+                               compress_type=compress_type)
+    pool = _png_executor() if len(images) > 1 else None
+    if pool is None:
+        return [encode(img) for img in images]
+    return list(pool.map(encode, images))
 
-    # 1. Finder Pattern
-    tpl = [[' ' for _ in range(size)] for _ in range(size)]
-    builder._finder(tpl)
-    img1 = Image.new("RGB", (img_size, img_size), background)
-    draw1 = __import__('PIL.ImageDraw', fromlist=['ImageDraw']).ImageDraw(img1)
-    for y in range(size):
-        for x in range(size):
-            if tpl[y][x] == 1:
-                px = x * scale + border_width
-                py = y * scale + border_width
-                draw1.rectangle([px, py, px + scale - 1, py + scale - 1], fill=color)
 
-    # 2. Alignment Pattern (Version 2+)
-    tpl2 = [row[:] for row in tpl]
-    if builder.version >= 2:
-        builder._alignment(tpl2)
-    img2 = Image.new("RGB", (img_size, img_size), background)
-    draw2 = __import__('PIL.ImageDraw', fromlist=['ImageDraw']).ImageDraw(img2)
-    for y in range(size):
-        for x in range(size):
-            if tpl2[y][x] == 1:
-                px = x * scale + border_width
-                py = y * scale + border_width
-                draw2.rectangle([px, py, px + scale - 1, py + scale - 1], fill=color)
+# ===== Build and Render Caches =====
+class _LRU:
+    """
+    Small thread-safe least-recently-used cache with hit/miss counters.
+    With maxbytes set, entries are also weighed with sizeof: the cache keeps at most
+    maxbytes in total, and a single value above maxbytes // 8 is not kept at all, so
+    one huge value cannot flush (or hold on to) the memory of many small ones.
+    """
 
-    # 3. Format Information
-    tpl3 = [row[:] for row in tpl2]
-    builder._type(tpl3, tp_bits['L'][mask_id])
-    img3 = Image.new("RGB", (img_size, img_size), background)
-    draw3 = __import__('PIL.ImageDraw', fromlist=['ImageDraw']).ImageDraw(img3)
-    for y in range(size):
-        for x in range(size):
-            if tpl3[y][x] == 1:
-                px = x * scale + border_width
-                py = y * scale + border_width
-                draw3.rectangle([px, py, px + scale - 1, py + scale - 1], fill=color)
+    def __init__(self, maxsize, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None on a miss.
+        """
+        with self._lock:
+            try:
+                value = self._data[key][0]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Store value under key, evicting the least recently used entries.
+        """
+        size = self.sizeof(value) if self.maxbytes is not None else 0
+        with self._lock:
+            if self.maxbytes is not None and size > self.maxbytes // 8:
+                return
+            if key in self._data:
+                self.nbytes -= self._data[key][1]
+            self._data[key] = (value, size)
+            self._data.move_to_end(key)
+            self.nbytes += size
+            self._evict()
+
+    def _evict(self):
+        # Drop least recently used entries until both limits hold; called with the lock held
+        while len(self._data) > self.maxsize or (self.maxbytes is not None and self.nbytes > self.maxbytes):
+            self.nbytes -= self._data.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        # Membership test without touching the counters or the LRU order
+        with self._lock:
+            return key in self._data
+
+
+# Memory kept by cached indexed renders (one byte per pixel); see set_render_cache_bytes
+RENDER_CACHE_BYTES = 32 * 1024 * 1024
+
+# Built QR codes keyed on content, and indexed renders keyed on matrix plus geometry
+_builds = _LRU(256)
+_indexed = _LRU(128, RENDER_CACHE_BYTES, lambda img: img.width * img.height)
+# Construction stage matrices keyed on content and mask
+_steps = _LRU(128)
+
+
+def clear_caches():
+    """
+    Drop all cached builds, construction stages and indexed renders.
+    """
+    _builds.clear()
+    _indexed.clear()
+    _steps.clear()
 
-    # 4. Data Bits
-    tpl4 = [row[:] for row in tpl3]
-    # Get encoded data bits
-    data_bits = builder.buf.getvalue()
-    bits = iter(data_bits)
-    row_start = itertools.cycle([len(tpl4) - 1, 0])
-    row_stop = itertools.cycle([-1, len(tpl4)])
-    direction = itertools.cycle([-1, 1])
-    for col in range(len(tpl4) - 1, 0, -2):
-        if col <= 6:
-            col -= 1
-        col_pair = itertools.cycle([col, col - 1])
-        for row in range(next(row_start), next(row_stop), next(direction)):
-            for _ in range(2):
-                c = next(col_pair)
-                if tpl4[row][c] != ' ':
-                    continue
-                try:
-                    bit = int(next(bits))
-                except StopIteration:
-                    bit = 0
-                tpl4[row][c] = bit
-    img4 = Image.new("RGB", (img_size, img_size), background)
-    draw4 = __import__('PIL.ImageDraw', fromlist=['ImageDraw']).ImageDraw(img4)
-    for y in range(size):
-        for x in range(size):
-            if tpl4[y][x] == 1:
-                px = x * scale + border_width
-                py = y * scale + border_width
-                draw4.rectangle([px, py, px + scale - 1, py + scale - 1], fill=color)
 
-    # 5. Final QR Code (After Masking)
-    mask = builder.masks[mask_id]
-    img5 = Image.new("RGB", (img_size, img_size), background)
-    draw5 = __import__('PIL.ImageDraw', fromlist=['ImageDraw']).ImageDraw(img5)
-    for y in range(size):
-        for x in range(size):
-            if mask[y][x] == 1:
-                px = x * scale + border_width
-                py = y * scale + border_width
-                draw5.rectangle([px, py, px + scale - 1, py + scale - 1], fill=color)
+def set_render_cache_bytes(nbytes):
+    """
+    Limit the memory kept by cached indexed renders. Renders larger than an
+    eighth of the limit are not cached; entries over the limit are evicted.
+
+    Args:
+        nbytes (int): Memory limit in bytes
+    """
+    with _indexed._lock:
+        _indexed.maxbytes = nbytes
+        _indexed._evict()
 
-    return [img1, img2, img3, img4, img5]
\ No newline at end of file
+
+def cache_stats():
+    """
+    Get the hit/miss counters and sizes of the build and render caches.
+
+    Returns:
+        dict: Cache name -> {'hits', 'misses', 'size', 'maxsize'}
+    """
+    return {name: {'hits': cache.hits, 'misses': cache.misses, 'size': len(cache), 'maxsize': cache.maxsize}
+            for name, cache in (('builds', _builds), ('indexed', _indexed), ('steps', _steps))}
+
+
+def pick_version(content):
+    """
+    Pick the smallest version whose byte mode capacity holds content, from its length
+    alone, so that oversized input is rejected before any encoding work.
+
+    Args:
+        content (str): Content to encode
+
+    Returns:
+        int: QR code version
+
+    Raises:
+        ValueError: If the content does not fit version 2
+    """
+    for version in (1, 2):
+        if len(content) <= cap[version]['L'][mds['binary']]:
+            return version
+    raise ValueError("Content too long for version 1 or 2 QR codes")
+
+
+def is_built(content):
+    """
+    Whether build_qr(content) would be served from the cache.
+
+    Args:
+        content (str): Content to encode
+
+    Returns:
+        bool: True if the build is cached
+    """
+    return content in _builds
+
+
+def build_qr(content, deadline=None):
+    """
+    Build the QR code for content with the smallest version that fits.
+    Builds are cached, so the returned builder is shared and must not be modified.
+
+    Args:
+        content (str): Content to encode
+        deadline (float): time.monotonic() value to stop at (see check_deadline)
+
+    Returns:
+        QRBuilder: Builder holding all 8 masks, their scores and the best mask
+    """
+    builder = _builds.get(content)
+    if builder is None:
+        pick_version(content)
+        try:
+            builder = QRBuilder(content, 1, 'binary', 'L', deadline=deadline)
+        except ValueError:
+            try:
+                builder = QRBuilder(content, 2, 'binary', 'L', deadline=deadline)
+            except ValueError:
+                raise ValueError("Content too long for version 1 or 2 QR codes")
+        _builds.put(content, builder)
+    return builder
+
+
+def warm_up(contents=()):
+    """
+    Precompute the per-version tables (templates, placement orders and
+    Reed-Solomon codecs) and build the given contents into the cache,
+    so that the first requests do not pay these costs.
+
+    Args:
+        contents (iterable): Contents to build in advance
+
+    Returns:
+        float: Seconds spent warming up
+    """
+    start = time.perf_counter()
+    for version in range(1, len(v_sz)):
+        QRBuilder('', version, 'binary', 'L')
+    for content in contents:
+        build_qr(content)
+    return time.perf_counter() - start
+
+
+def pack_modules(code):
+    """
+    Pack a QR matrix into bytes, one bit per module (1 = dark).
+    Modules are stored row by row, most significant bit first, and the
+    last byte is padded with zeros.
+
+    Args:
+        code (list): QR code matrix
+
+    Returns:
+        bytes: Packed modules (ceil(size * size / 8) bytes)
+    """
+    bits = ''.join('1' if v == 1 else '0' for row in code for v in row)
+    pad = -len(bits) % 8
+    return int(bits + '0' * pad, 2).to_bytes((len(bits) + pad) // 8, 'big')
+
+
+# Lookup table turning palette index 1 (dark module) into an opaque mask pixel
+_DARK_LUT = bytes(255 if i == 1 else 0 for i in range(256))
+
+
+def _indexed_image(code, scale, border_width, shape="square"):
+    """
+    Render a QR matrix as a palette ("P") image.
+    Index 0 is the background, 1 the dark modules and 2 the border, so the
+    colors are only applied later by swapping the palette (see _colorize).
+    Renders are cached on the matrix and geometry and must not be modified.
+
+    Args:
+        code (list): QR code matrix (cells equal to 1 are drawn)
+        scale (int): Size scale
+        border_width (int): Border width
+        shape (str): Module shape ('square' or 'circle')
+
+    Returns:
+        PIL.Image: Indexed image
+    """
+    key = (tuple(tuple(row) for row in code), scale, border_width, shape)
+    img = _indexed.get(key)
+    if img is not None:
+        return img
+
+    size = len(code)
+    img_size = size * scale + 2 * border_width
+    img = Image.new("P", (img_size, img_size), 0)
+    draw = ImageDraw.Draw(img)
+
+    # Border
+    if border_width > 0:
+        img.paste(2, (0, 0, img_size, border_width))
+        img.paste(2, (0, img_size - border_width, img_size, img_size))
+        img.paste(2, (0, 0, border_width, img_size))
+        img.paste(2, (img_size - border_width, 0, img_size, img_size))
+
+    # Modules
+    for y in range(size):
+        for x in range(size):
+            if code[y][x] == 1:
+                px = x * scale + border_width
+                py = y * scale + border_width
+                if shape == "circle":
+                    draw.ellipse([px, py, px + scale - 1, py + scale - 1], fill=1)
+                else:
+                    draw.rectangle([px, py, px + scale - 1, py + scale - 1], fill=1)
+
+    _indexed.put(key, img)
+    return img
+
+
+def _colorize(indexed, color, background, border_color):
+    """
+    Apply colors to an indexed render by writing its palette.
+
+    Args:
+        indexed (PIL.Image): Image from _indexed_image
+        color: QR code color
+        background: Background color
+        border_color: Border color
+
+    Returns:
+        PIL.Image: New palette image with the given colors
+    """
+    img = indexed.copy()
+    img.putpalette(color_to_rgb(background) + color_to_rgb(color) + color_to_rgb(border_color))
+    return img
+
+
+def _render_styled(code, color="#000000", background="#ffffff", scale=10, border_width=4,
+                   border_color="#000000", shape="square", gradient_type="none", gradient_colors=None):
+    """
+    Render a QR matrix with the given style.
+    Solid colors give a palette image; gradients need an RGB image.
+
+    Args:
+        code (list): QR code matrix
+        color (str): QR code color (hex)
+        background (str): Background color (hex)
+        scale (int): Size scale
+        border_width (int): Border width
+        border_color (str): Border color (hex)
+        shape (str): Module shape ('square' or 'circle')
+        gradient_type (str): Gradient type ('none', 'linear', or 'radial')
+        gradient_colors (list): List of two colors for gradient
+
+    Returns:
+        PIL.Image: QR code image
+    """
+    indexed = _indexed_image(code, scale, border_width, shape)
+    img = _colorize(indexed, color, background, border_color)
+    if gradient_type == "none" or not gradient_colors or len(gradient_colors) != 2:
+        return img
+
+    # Gradient support: one gradient pixel per module, scaled up and masked by the dark modules
+    size = len(code)
+    grad_img = create_linear_gradient(
+        (size, size),
+        hex_to_rgb(gradient_colors[0]),
+        hex_to_rgb(gradient_colors[1]),
+        horizontal=(gradient_type == "linear")
+    )
+    area = (border_width, border_width, border_width + size * scale, border_width + size * scale)
+    modules = indexed.crop(area)
+    dark = Image.frombytes("L", modules.size, modules.tobytes().translate(_DARK_LUT))
+    img = img.convert("RGB")
+    img.paste(grad_img.resize(modules.size, Image.NEAREST), area[:2], dark)
+    return img
+
+
+# ===== SVG Output =====
+def _svg_color(color):
+    """
+    Normalize a color specification to an SVG hex color.
+    """
+    return '#%02x%02x%02x' % color_to_rgb(color)
+
+
+def _svg_path(code, scale, offset, shape="square"):
+    """
+    Build SVG path data for the dark modules of a QR matrix.
+    Horizontal runs of square modules are merged into a single rectangle,
+    so the path length depends on the symbol and not on the pixel scale.
+
+    Args:
+        code (list): QR code matrix
+        scale (int): Size scale
+        offset (int): Distance of the matrix from the image edge
+        shape (str): Module shape ('square' or 'circle')
+
+    Returns:
+        str: Path data
+    """
+    parts = []
+    size = len(code)
+    r = scale / 2
+    for y, row in enumerate(code):
+        py = offset + y * scale
+        x = 0
+        while x < size:
+            if row[x] != 1:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x] == 1:
+                x += 1
+            if shape == "circle":
+                for i in range(start, x):
+                    px = offset + i * scale
+                    parts.append(f"M{px:g} {py + r:g}a{r:g} {r:g} 0 1 0 {scale:g} 0a{r:g} {r:g} 0 1 0 -{scale:g} 0z")
+            else:
+                run = (x - start) * scale
+                parts.append(f"M{offset + start * scale:g} {py:g}h{run:g}v{scale:g}h-{run:g}z")
+    return ''.join(parts)
+
+
+def _svg(code, scale, color, background, border_width, border_color, shape="square",
+         gradient_type="none", gradient_colors=None):
+    """
+    Build an SVG document for a QR matrix with the given style.
+
+    Args:
+        code (list): QR code matrix
+        scale (int): Size scale
+        color: QR code color
+        background: Background color
+        border_width (int): Border width
+        border_color: Border color
+        shape (str): Module shape ('square' or 'circle')
+        gradient_type (str): Gradient type ('none', 'linear', or 'radial')
+        gradient_colors (list): List of two colors for gradient
+
+    Returns:
+        str: SVG document
+    """
+    size = len(code)
+    inner = size * scale
+    img_size = inner + 2 * border_width
+    rendering = '' if shape == "circle" else ' shape-rendering="crispEdges"'
+    out = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{img_size}" height="{img_size}" '
+           f'viewBox="0 0 {img_size} {img_size}"{rendering}>']
+
+    fill = _svg_color(color)
+    if gradient_type != "none" and gradient_colors and len(gradient_colors) == 2:
+        # Same direction as the raster output: 'linear' runs left to right, 'radial' top to bottom
+        first = border_width + scale / 2
+        last = border_width + inner - scale / 2
+        x2, y2 = (last, first) if gradient_type == "linear" else (first, last)
+        out.append(f'<defs><linearGradient id="g" gradientUnits="userSpaceOnUse" '
+                   f'x1="{first:g}" y1="{first:g}" x2="{x2:g}" y2="{y2:g}">'
+                   f'<stop offset="0" stop-color="{_svg_color(gradient_colors[0])}"/>'
+                   f'<stop offset="1" stop-color="{_svg_color(gradient_colors[1])}"/>'
+                   f'</linearGradient></defs>')
+        fill = 'url(#g)'
+
+    if border_width > 0:
+        out.append(f'<rect width="{img_size}" height="{img_size}" fill="{_svg_color(border_color)}"/>')
+        out.append(f'<rect x="{border_width}" y="{border_width}" width="{inner}" height="{inner}" '
+                   f'fill="{_svg_color(background)}"/>')
+    else:
+        out.append(f'<rect width="{img_size}" height="{img_size}" fill="{_svg_color(background)}"/>')
+    out.append(f'<path fill="{fill}" d="{_svg_path(code, scale, border_width, shape)}"/>')
+    out.append('</svg>')
+    return '\n'.join(out)
+
+
+# ===== QR Code Image Generation and Advanced Styling =====
+@timed('qr_img')
+def qr_img(data, color="#000000", background="#ffffff", scale=10, border_width=4, border_color="#000000",
+           shape="square", gradient_type="none", gradient_colors=None, mask_id=None, as_png=False,
+           png_preset='balanced', deadline=None, **kwargs):
+    """
+    Generate QR code image with custom styling.
+
+    Args:
+        data (str): Content to encode
+        color (str): QR code color (hex)
+        background (str): Background color (hex)
+        scale (int): Size scale
+        border_width (int): Border width
+        border_color (str): Border color (hex)
+        shape (str): Module shape ('square' or 'circle')
+        gradient_type (str): Gradient type ('none', 'linear', or 'radial')
+        gradient_colors (list): List of two colors for gradient
+        mask_id (int): Mask pattern index (default: the best mask)
+        as_png (bool): Return encoded PNG bytes instead of the image
+        png_preset (str): PNG encoder preset used with as_png (see PNG_PRESETS)
+        deadline (float): time.monotonic() value to stop at (see check_deadline)
+        **kwargs: Additional styling parameters
+
+    Returns:
+        PIL.Image: QR code image (palette mode without gradient), or bytes if as_png is True
+    """
+    builder = build_qr(data, deadline)
+    code = builder.code if mask_id is None else builder.masks[mask_id]
+    check_deadline(deadline)
+    img = _render_styled(code, color, background, scale, border_width, border_color, shape,
+                         gradient_type, gradient_colors)
+    if as_png:
+        check_deadline(deadline)
+        return encode_png(img, png_preset)
+    return img
+
+
+@timed('qr_svg')
+def qr_svg(data, color="#000000", background="#ffffff", scale=10, border_width=4, border_color="#000000",
+           shape="square", gradient_type="none", gradient_colors=None, mask_id=None, deadline=None, **kwargs):
+    """
+    Generate QR code as an SVG document with custom styling.
+    Takes the same styling options as qr_img and produces the same picture
+    as a vector image whose size does not grow with scale.
+
+    Args:
+        data (str): Content to encode
+        color (str): QR code color (hex)
+        background (str): Background color (hex)
+        scale (int): Size scale
+        border_width (int): Border width
+        border_color (str): Border color (hex)
+        shape (str): Module shape ('square' or 'circle')
+        gradient_type (str): Gradient type ('none', 'linear', or 'radial')
+        gradient_colors (list): List of two colors for gradient
+        mask_id (int): Mask pattern index (default: the best mask)
+        deadline (float): time.monotonic() value to stop at (see check_deadline)
+        **kwargs: Additional styling parameters
+
+    Returns:
+        str: SVG document
+    """
+    builder = build_qr(data, deadline)
+    code = builder.code if mask_id is None else builder.masks[mask_id]
+    check_deadline(deadline)
+    return _svg(code, scale, color, background, border_width, border_color, shape,
+                gradient_type, gradient_colors)
+
+
+@timed('generate_qr_code2')
+def generate_qr_code2(input_string, color="#000000", background="#ffffff", scale=10,
+                     border_width=4, border_color="#000000", gradient_type="none",
+                     gradient_colors=None, return_version=False, as_png=False, png_preset='balanced',
+                     deadline=None):
+    """
+    Generate QR code with advanced styling options.
+    Without a gradient the images are palette images, so changing only the
+    colors reuses the cached build and renders and just rewrites the palette.
+
+    Args:
+        input_string (str): Content to encode
+        color (str): QR code color (hex)
+        background (str): Background color (hex)
+        scale (int): Size scale
+        border_width (int): Border width
+        border_color (str): Border color (hex)
+        gradient_type (str): Gradient type ('none', 'linear', or 'radial')
+        gradient_colors (list): List of two colors for gradient
+        return_version (bool): Whether to return QR code version
+        as_png (bool): Return encoded PNG bytes instead of images (encoded together, see encode_png_many)
+        png_preset (str): PNG encoder preset used with as_png (see PNG_PRESETS)
+        deadline (float): time.monotonic() value to stop at (see check_deadline)
+
+    Returns:
+        tuple: (mask_images, mask_scores, best_mask[, version])
+    """
+    builder = build_qr(input_string, deadline)
+    # Detailed scoring
+    mask_scores = [list(score) for score in builder.scores]
+    best_mask = builder.best_mask
+    version = builder.version
+
+    # Generate QR code images for all 8 masks
+    mask_images = []
+    for mask in builder.masks:
+        check_deadline(deadline)
+        mask_images.append(_render_styled(mask, color, background, scale, border_width, border_color,
+                                          gradient_type=gradient_type, gradient_colors=gradient_colors))
+    if as_png:
+        check_deadline(deadline)
+        mask_images = encode_png_many(mask_images, png_preset)
+
+    if return_version:
+        return mask_images, mask_scores, best_mask, version
+    else:
+        return mask_images, mask_scores, best_mask
+
+
+def mask_sheet(input_string, color="#000000", background="#ffffff", scale=4, columns=4,
+               highlight="#ff0000", as_png=False, png_preset='balanced', deadline=None):
+    """
+    Draw all 8 candidate masks as thumbnails on one contact sheet.
+    Each thumbnail is labelled with its mask index, total penalty and the four
+    rule scores from calculate_penalty; the best mask is framed and labelled in
+    the highlight color. The sheet is a single palette image, so it costs one
+    encode instead of eight.
+
+    Args:
+        input_string (str): Content to encode
+        color (str): QR code and label color (hex)
+        background (str): Background color (hex)
+        scale (int): Thumbnail size scale (pixels per module)
+        columns (int): Thumbnails per row
+        highlight (str): Color of the best mask frame and label (hex)
+        as_png (bool): Return encoded PNG bytes instead of the image
+        png_preset (str): PNG encoder preset used with as_png (see PNG_PRESETS)
+        deadline (float): time.monotonic() value to stop at (see check_deadline)
+
+    Returns:
+        PIL.Image: Contact sheet, or bytes if as_png is True
+    """
+    builder = build_qr(input_string, deadline)
+    font = ImageFont.load_default()
+    line = font.getbbox("0")[3] + 2
+    pad = 2 * scale
+    thumb = len(builder.code) * scale
+    cell_w = max(thumb, font.getbbox("R 000/000/000/000")[2]) + 2 * pad
+    cell_h = thumb + 2 * pad + 2 * line
+    rows = (len(builder.masks) + columns - 1) // columns
+
+    # Index 0 is the background, 1 the modules and labels, 2 the highlight
+    sheet = Image.new("P", (cell_w * columns, cell_h * rows), 0)
+    sheet.putpalette(color_to_rgb(background) + color_to_rgb(color) + color_to_rgb(highlight))
+    draw = ImageDraw.Draw(sheet)
+    for idx, (mask, score) in enumerate(zip(builder.masks, builder.scores)):
+        check_deadline(deadline)
+        left = (idx % columns) * cell_w
+        top = (idx // columns) * cell_h
+        x0 = left + (cell_w - thumb) // 2
+        y0 = top + pad
+        sheet.paste(_indexed_image(mask, scale, 0), (x0, y0))
+        label = 2 if idx == builder.best_mask else 1
+        if idx == builder.best_mask:
+            draw.rectangle([left, top, left + cell_w - 1, top + cell_h - 1], outline=2)
+        draw.text((left + pad, y0 + thumb + pad // 2), f"Mask {idx}: {sum(score)}", fill=label, font=font)
+        draw.text((left + pad, y0 + thumb + pad // 2 + line), "R " + "/".join(map(str, score)),
+                  fill=label, font=font)
+
+    if as_png:
+        check_deadline(deadline)
+        return encode_png(sheet, png_preset)
+    return sheet
+
+
+# ===== Step-by-Step QR Code Construction Visualization =====
+# Number of construction stages shown by the step-by-step display
+STEP_COUNT = 5
+
+# Border width (drawn in the background color) of the construction step images
+STEP_BORDER = 4
+
+# Animated walkthrough formats: Pillow format name and MIME type
+ANIMATION_FORMATS = {'gif': ('GIF', 'image/gif'), 'apng': ('PNG', 'image/apng')}
+
+
+def _step_matrices(input_string, mask_id=0, deadline=None):
+    """
+    Build the matrices of the construction stages: finder patterns, alignment
+    pattern, format information, data bits and the final masked code.
+    Stages are cached per content and mask, so they must not be modified.
+
+    Args:
+        input_string (str): Content to encode
+        mask_id (int): Mask pattern index
+        deadline (float): time.monotonic() value to stop at (see check_deadline)
+
+    Returns:
+        list: STEP_COUNT QR code matrices
+    """
+    key = (input_string, mask_id)
+    stages = _steps.get(key)
+    if stages is not None:
+        return stages
+
+    builder = build_qr(input_string, deadline)
+    size = len(builder.masks[0])
+
+    # 1. Finder Pattern
+    tpl = [[' ' for _ in range(size)] for _ in range(size)]
+    builder._finder(tpl)
+
+    # 2. Alignment Pattern (Version 2+)
+    tpl2 = [row[:] for row in tpl]
+    if builder.version >= 2:
+        builder._alignment(tpl2)
+
+    # 3. Format Information
+    tpl3 = [row[:] for row in tpl2]
+    builder._type(tpl3, tp_bits['L'][mask_id])
+
+    # 4. Data Bits
+    tpl4 = [row[:] for row in tpl3]
+    # Get encoded data bits
+    data_bits = builder.buf.getvalue()
+    for i, (row, c) in enumerate(builder._placement()):
+        tpl4[row][c] = int(data_bits[i]) if i < len(data_bits) else 0
+
+    # 5. Final QR Code (After Masking)
+    mask = builder.masks[mask_id]
+
+    stages = [tpl, tpl2, tpl3, tpl4, mask]
+    _steps.put(key, stages)
+    return stages
+
+
+def _indexed_step(input_string, step, scale, mask_id=0, deadline=None):
+    """
+    Indexed render of a construction stage.
+    Each stage starts from a copy of the previous stage's render and only the
+    modules that changed between the two stages are painted, so the whole
+    walkthrough costs about one full render. Renders are cached.
+
+    Args:
+        input_string (str): Content to encode
+        step (int): Construction step index (0 to STEP_COUNT - 1)
+        scale (int): Size scale
+        mask_id (int): Mask pattern index
+        deadline (float): time.monotonic() value to stop at (see check_deadline)
+
+    Returns:
+        PIL.Image: Indexed image (see _indexed_image)
+    """
+    key = ('step', input_string, mask_id, step, scale)
+    img = _indexed.get(key)
+    if img is not None:
+        return img
+
+    stages = _step_matrices(input_string, mask_id, deadline)
+    if step == 0:
+        img = _indexed_image(stages[0], scale, STEP_BORDER)
+    else:
+        img = _indexed_step(input_string, step - 1, scale, mask_id, deadline).copy()
+        check_deadline(deadline)
+        _paint_step(img, stages[step - 1], stages[step], scale)
+
+    _indexed.put(key, img)
+    return img
+
+
+def _indexed_steps(input_string, scale, mask_id=0, deadline=None):
+    """
+    Indexed renders of all construction stages, built in a single pass: each
+    uncached stage is painted on a copy of the previous one, so the walkthrough
+    costs about one full render even when the stages are too large to be cached.
+
+    Args:
+        input_string (str): Content to encode
+        scale (int): Size scale
+        mask_id (int): Mask pattern index
+        deadline (float): time.monotonic() value to stop at (see check_deadline)
+
+    Returns:
+        list: STEP_COUNT indexed images (see _indexed_image)
+    """
+    stages = _step_matrices(input_string, mask_id, deadline)
+    images = []
+    for step in range(STEP_COUNT):
+        key = ('step', input_string, mask_id, step, scale)
+        img = _indexed.get(key)
+        if img is None:
+            check_deadline(deadline)
+            if step == 0:
+                img = _indexed_image(stages[0], scale, STEP_BORDER)
+            else:
+                img = images[-1].copy()
+                _paint_step(img, stages[step - 1], stages[step], scale)
+            _indexed.put(key, img)
+        images.append(img)
+    return images
+
+
+def _paint_step(img, prev, cur, scale):
+    """
+    Paint the modules that differ between two stage matrices onto a stage render, in place.
+
+    Args:
+        img (PIL.Image): Indexed render of the prev stage
+        prev (list): Previous stage matrix
+        cur (list): Stage matrix to paint
+        scale (int): Size scale
+    """
+    draw = ImageDraw.Draw(img)
+    for y in range(len(cur)):
+        for x in range(len(cur)):
+            dark = cur[y][x] == 1
+            if dark == (prev[y][x] == 1):
+                continue
+            px = x * scale + STEP_BORDER
+            py = y * scale + STEP_BORDER
+            draw.rectangle([px, py, px + scale - 1, py + scale - 1], fill=1 if dark else 0)
+
+
+def generate_step_image(input_string, step, color="#000000", background="#ffffff", scale=10, mask_id=0,
+                        as_png=False, png_preset='balanced', deadline=None):
+    """
+    Generate the image of a single QR code construction step.
+    Only the requested stage (and any uncached earlier stage it is painted on) is
+    rendered; the build and stages come from the cache.
+
+    Args:
+        input_string (str): Content to encode
+        step (int): Construction step index (0 to STEP_COUNT - 1)
+        color (str): QR code color (hex)
+        background (str): Background color (hex)
+        scale (int): Size scale
+        mask_id (int): Mask pattern index
+        as_png (bool): Return encoded PNG bytes instead of the image
+        png_preset (str): PNG encoder preset used with as_png (see PNG_PRESETS)
+        deadline (float): time.monotonic() value to stop at (see check_deadline)
+
+    Returns:
+        PIL.Image: Image of the construction step, or bytes if as_png is True
+    """
+    check_deadline(deadline)
+    # The border is drawn in the background color
+    img = _colorize(_indexed_step(input_string, step, scale, mask_id, deadline), color, background, background)
+    if as_png:
+        check_deadline(deadline)
+        return encode_png(img, png_preset)
+    return img
+
+
+def _animate(frames, fmt, duration=1500, loop=0):
+    """
+    Encode indexed frames as one animated GIF or APNG.
+    All frames share one palette, and Pillow stores each frame after the first
+    as the bounding box of what changed since the previous frame, so a stage only
+    costs the modules it adds.
+
+    Args:
+        frames (list): Indexed images with the same size and palette
+        fmt (str): 'gif' or 'apng' (see ANIMATION_FORMATS)
+        duration (int): Display time of each frame, in milliseconds
+        loop (int): Number of loops, 0 to repeat forever
+
+    Returns:
+        bytes: Encoded animation
+    """
+    if fmt not in ANIMATION_FORMATS:
+        raise ValueError(f"Unsupported animation format: {fmt}")
+    buf = io.BytesIO()
+    frames[0].save(buf, format=ANIMATION_FORMATS[fmt][0], save_all=True, append_images=frames[1:],
+                   duration=duration, loop=loop)
+    return buf.getvalue()
+
+
+def generate_step_images(input_string, color="#000000", background="#ffffff", scale=10, mask_id=0,
+                         as_png=False, png_preset='balanced', animation=None, duration=1500, deadline=None):
+    """
+    Generate step-by-step QR code construction images.
+
+    Args:
+        input_string (str): Content to encode
+        color (str): QR code color (hex)
+        background (str): Background color (hex)
+        scale (int): Size scale
+        mask_id (int): Mask pattern index
+        as_png (bool): Return encoded PNG bytes instead of images (encoded together, see encode_png_many)
+        png_preset (str): PNG encoder preset used with as_png (see PNG_PRESETS)
+        animation (str): 'gif' or 'apng' to return the whole walkthrough as one animation
+        duration (int): Display time of each animation frame, in milliseconds
+        deadline (float): time.monotonic() value to stop at (see check_deadline)
+
+    Returns:
+        list: List of PIL.Image objects (or PNG bytes) showing construction steps,
+            or the animation bytes if animation is set
+    """
+    # The border is drawn in the background color
+    frames = [_colorize(img, color, background, background)
+              for img in _indexed_steps(input_string, scale, mask_id, deadline)]
+    if animation:
+        check_deadline(deadline)
+        return _animate(frames, animation, duration)
+    if as_png:
+        check_deadline(deadline)
+        return encode_png_many(frames, png_preset)
+    return frames
+
+
+# ===== Async Interface =====
+# Executor used by make_qr_async and render_async when none is passed (see set_executor)
+_executor = None
+
+
+def set_executor(executor):
+    """
+    Set the default executor of make_qr_async and render_async.
+    Thread pools share this module's caches; process pools spread the CPU work
+    over several cores, but every worker process keeps caches of its own.
+
+    Args:
+        executor (concurrent.futures.Executor): Executor, or None for the event loop's default thread pool
+    """
+    global _executor
+    _executor = executor
+
+
+async def _offload(executor, func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs) in the executor and wait for it without blocking the event loop.
+    """
+    # Imported here: only async callers pay for asyncio
+    import asyncio
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor or _executor, functools.partial(func, *args, **kwargs))
+
+
+async def make_qr_async(content, error='L', version=None, mode='binary', encoding=None, executor=None):
+    """
+    Async counterpart of make_qr: the QR code is built in an executor.
+
+    Args:
+        content (str): Content to encode
+        error (str): Error correction level
+        version (int): QR code version (default: the smallest that fits)
+        mode (str): Encoding mode (only 'binary' is supported)
+        encoding (str): Character encoding
+        executor (concurrent.futures.Executor): Executor to build in (default: see set_executor)
+
+    Returns:
+        QRCode: QR code object
+    """
+    return await _offload(executor, make_qr, content, error, version, mode, encoding)
+
+
+async def render_async(data, fmt='png', executor=None, **kwargs):
+    """
+    Async counterpart of qr_img and qr_svg: the QR code is built, rendered and
+    encoded in an executor. Only the encoded result crosses back, so process
+    pools do not have to pickle images.
+
+    Args:
+        data (str): Content to encode
+        fmt (str): 'png' or 'svg'
+        executor (concurrent.futures.Executor): Executor to render in (default: see set_executor)
+        **kwargs: Styling options, mask_id, png_preset and deadline, as for qr_img and qr_svg
+
+    Returns:
+        bytes: PNG bytes, or str: SVG document
+    """
+    if fmt == 'svg':
+        return await _offload(executor, qr_svg, data, **kwargs)
+    if fmt != 'png':
+        raise ValueError(f"Unsupported image format: {fmt}")
+    return await _offload(executor, qr_img, data, as_png=True, **kwargs)
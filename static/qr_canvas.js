@@ -0,0 +1,86 @@
+/*
+ * Client-side QR code rendering for the web demo.
+ * Draws the packed module bits served by /qr.json (or passed to the page as qr_modules)
+ * on a canvas, with the same style options as the version 2 form, so changing colors,
+ * scale, border or gradient needs no round trip to the server.
+ */
+
+// Draw a QR code.
+// data: {size, modules} with modules base64-encoded, row-major, most significant bit first
+// style: {color, background, scale, borderWidth, borderColor, gradientType, gradientColors, shape}
+function drawQRCode(canvas, data, style) {
+    style = Object.assign({
+        color: '#000000',
+        background: '#ffffff',
+        scale: 10,
+        borderWidth: 4,
+        borderColor: '#000000',
+        gradientType: 'none',
+        gradientColors: ['#FF0000', '#0000FF'],
+        shape: 'square'
+    }, style || {});
+
+    var size = data.size;
+    var scale = Number(style.scale);
+    var border = Number(style.borderWidth);
+    var inner = size * scale;
+    var full = inner + 2 * border;
+    canvas.width = full;
+    canvas.height = full;
+    var ctx = canvas.getContext('2d');
+
+    // Border and background
+    ctx.fillStyle = style.borderColor;
+    ctx.fillRect(0, 0, full, full);
+    ctx.fillStyle = style.background;
+    ctx.fillRect(border, border, inner, inner);
+
+    // Gradient support: 'linear' runs left to right, 'radial' top to bottom (as on the server)
+    var fill = style.color;
+    if (style.gradientType !== 'none' && style.gradientColors && style.gradientColors.length === 2) {
+        var first = border + scale / 2;
+        var last = border + inner - scale / 2;
+        fill = style.gradientType === 'linear'
+            ? ctx.createLinearGradient(first, first, last, first)
+            : ctx.createLinearGradient(first, first, first, last);
+        fill.addColorStop(0, style.gradientColors[0]);
+        fill.addColorStop(1, style.gradientColors[1]);
+    }
+    ctx.fillStyle = fill;
+
+    // Dark modules
+    var bits = atob(data.modules);
+    for (var y = 0; y < size; y++) {
+        for (var x = 0; x < size; x++) {
+            var i = y * size + x;
+            if (!((bits.charCodeAt(i >> 3) >> (7 - (i & 7))) & 1)) {
+                continue;
+            }
+            var px = border + x * scale;
+            var py = border + y * scale;
+            if (style.shape === 'circle') {
+                ctx.beginPath();
+                ctx.arc(px + scale / 2, py + scale / 2, scale / 2, 0, 2 * Math.PI);
+                ctx.fill();
+            } else {
+                ctx.fillRect(px, py, scale, scale);
+            }
+        }
+    }
+}
+
+// Fetch the matrix for text from /qr.json and draw it; resolves with the metadata
+// (version, size, best_mask) so the page can show it.
+function loadQRCode(canvas, text, style) {
+    return fetch('/qr.json?text=' + encodeURIComponent(text))
+        .then(function (response) {
+            if (!response.ok) {
+                throw new Error('Failed to generate QR code: ' + response.status);
+            }
+            return response.json();
+        })
+        .then(function (data) {
+            drawQRCode(canvas, data, style);
+            return data;
+        });
+}
@@ -0,0 +1,28 @@
+'''
+Smoke test of the async generation API with its default arguments.
+Run with `python -m pytest tests` or `python -m unittest discover tests`.
+'''
+
+import asyncio
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import qr_generator_version2
+
+
+class AsyncApiTest(unittest.TestCase):
+    def test_make_qr_async_defaults(self):
+        code = asyncio.run(qr_generator_version2.make_qr_async('Hello'))
+        self.assertEqual(code.version, 1)
+
+    def test_render_async_defaults(self):
+        data = asyncio.run(qr_generator_version2.render_async('Hello'))
+        self.assertEqual(data, qr_generator_version2.qr_img('Hello', as_png=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+'''
+Import-time budget of the web service: `import app` must stay fast and must not load
+the desktop GUI (Tk) or the modules only needed while encoding (reedsolo, png).
+Run with `python -m pytest tests` or `python -m unittest discover tests`.
+'''
+
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time of app.py without warm-up, in seconds (about 0.2 s on a laptop)
+IMPORT_BUDGET = 1.0
+
+# Modules that importing the web service must not load
+LAZY_MODULES = ('tkinter', 'PIL.ImageTk', 'reedsolo', 'png')
+
+
+def import_times(module):
+    """
+    Import module in a fresh interpreter with -X importtime.
+    Returns {imported module: cumulative microseconds}.
+    """
+    env = dict(os.environ, FLASK_QR_WARMUP='false')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+class ImportTimeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.times = import_times('app')
+
+    def test_within_budget(self):
+        self.assertLess(self.times['app'] / 1e6, IMPORT_BUDGET)
+
+    def test_lazy_modules_not_imported(self):
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, self.times)
+
+
+if __name__ == '__main__':
+    unittest.main()
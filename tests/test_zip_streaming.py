@@ -0,0 +1,42 @@
+'''
+/generate_zip must stream: the first chunk of the archive is sent after the first code
+is rendered, not after the whole upload has been rendered (e.g. by the metrics hook).
+Run with `python -m pytest tests` or `python -m unittest discover tests`.
+'''
+
+import io
+import os
+import sys
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('FLASK_QR_WARMUP', 'false')
+
+import app
+
+# Contents in the uploaded file
+ITEMS = 30
+
+
+class ZipStreamingTest(unittest.TestCase):
+    def test_first_chunk_before_all_codes(self):
+        flask_app = app.create_app({'QR_METRICS': True, 'QR_WARMUP': False})
+        upload = '\n'.join(f'stream {i}' for i in range(ITEMS)).encode('utf-8')
+        with mock.patch.object(app, 'encode_image', wraps=app.encode_image) as encode:
+            response = flask_app.test_client().post(
+                '/generate_zip', data={'file': (io.BytesIO(upload), 'contents.txt')}, buffered=False)
+            self.assertEqual(response.status_code, 200)
+            chunks = iter(response.response)
+            first = next(chunks)
+            self.assertTrue(first.startswith(b'PK'))
+            self.assertLess(encode.call_count, ITEMS)
+            rest = b''.join(chunks)
+            response.close()
+        self.assertEqual(encode.call_count, ITEMS)
+        self.assertTrue(rest)
+
+
+if __name__ == '__main__':
+    unittest.main()